@@ -0,0 +1,96 @@
+"""
+Timing of the IntervalSet operations.
+
+Run from the repository root with
+
+.. code:: bash
+
+    python benchmarks/bench_interval_set.py
+
+The set operations are compared against the previous pandas implementation (sort of the concatenated
+boundaries and cumulative sum in a temporary DataFrame), reproduced here as a reference. The construction
+of an IntervalSet from arrays already in the standard format is compared with the regular constructor.
+"""
+import timeit
+
+import numpy as np
+import pandas as pd
+
+import neuroseries as nts
+
+
+def random_interval_set(n, seed):
+    rng = np.random.RandomState(seed)
+    t = np.cumsum(rng.randint(1, 1000, 2 * n)).astype(np.int64)
+    return nts.IntervalSet(t[::2], t[1::2])
+
+
+def _pandas_cumsum(time, start_end):
+    df = pd.DataFrame({'time': time, 'start_end': start_end})
+    df.sort_values(by='time', inplace=True)
+    df.reset_index(inplace=True, drop=True)
+    df['cumsum'] = df['start_end'].cumsum()
+    return df['time'].values, df['cumsum'].values
+
+
+def pandas_intersect(a, b):
+    time = np.hstack((a['start'], b['start'], a['end'], b['end']))
+    start_end = np.hstack((np.ones(len(time) // 2, dtype=np.int32), -1 * np.ones(len(time) // 2, dtype=np.int32)))
+    time, cumsum = _pandas_cumsum(time, start_end)
+    ix = np.nonzero(cumsum == 2)[0]
+    return nts.IntervalSet(time[ix], time[ix + 1])
+
+
+def pandas_union(a, b):
+    time = np.hstack((a['start'], b['start'], a['end'], b['end']))
+    start_end = np.hstack((np.ones(len(time) // 2, dtype=np.int32), -1 * np.ones(len(time) // 2, dtype=np.int32)))
+    time, cumsum = _pandas_cumsum(time, start_end)
+    ix_stop = np.nonzero(cumsum == 0)[0]
+    ix_start = np.hstack((0, ix_stop[:-1] + 1))
+    return nts.IntervalSet(time[ix_start], time[ix_stop])
+
+
+def pandas_set_diff(a, b):
+    time = np.hstack((a['start'], a['end'], b['start'], b['end']))
+    start_end = np.hstack((np.ones(len(a), dtype=np.int32), -1 * np.ones(len(a), dtype=np.int32),
+                           -1 * np.ones(len(b), dtype=np.int32), np.ones(len(b), dtype=np.int32)))
+    time, cumsum = _pandas_cumsum(time, start_end)
+    ix = np.nonzero(cumsum == 1)[0]
+    return nts.IntervalSet(time[ix], time[ix + 1])
+
+
+def bench(stmt, number=3):
+    return min(timeit.repeat(stmt, number=1, repeat=number))
+
+
+def bench_set_ops(sizes=(1000, 10000, 100000, 1000000, 10000000)):
+    print('{:>10} {:>10} {:>12} {:>12} {:>8}'.format('n', 'op', 'pandas (s)', 'sweep (s)', 'speedup'))
+    for n in sizes:
+        a = random_interval_set(n, 0)
+        b = random_interval_set(n, 1)
+        cases = (
+            ('intersect', lambda: pandas_intersect(a, b), lambda: a.intersect(b)),
+            ('union', lambda: pandas_union(a, b), lambda: a.union(b)),
+            ('set_diff', lambda: pandas_set_diff(a, b), lambda: a.set_diff(b)),
+        )
+        for name, old, new in cases:
+            t_old = bench(old)
+            t_new = bench(new)
+            print('{:>10} {:>10} {:>12.4f} {:>12.4f} {:>8.1f}'.format(n, name, t_old, t_new, t_old / t_new))
+
+
+def bench_construction(sizes=(1000, 100000, 10000000)):
+    print('{:>10} {:>16} {:>20} {:>8}'.format('n', 'IntervalSet (s)', 'from_sorted_arrays (s)', 'speedup'))
+    for n in sizes:
+        t = np.cumsum(np.random.RandomState(0).randint(1, 1000, 2 * n)).astype(np.int64)
+        data = t.reshape((-1, 2))
+        start = data[:, 0].copy()
+        end = data[:, 1].copy()
+        t_old = bench(lambda: nts.IntervalSet(start, end))
+        t_new = bench(lambda: nts.IntervalSet.from_sorted_arrays(data))
+        print('{:>10} {:>16.6f} {:>20.6f} {:>8.1f}'.format(n, t_old, t_new, t_old / t_new))
+
+
+if __name__ == '__main__':
+    bench_set_ops()
+    bench_construction()
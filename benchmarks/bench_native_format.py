@@ -0,0 +1,89 @@
+"""
+Timing of the native on-disk format against pandas HDFStore.
+
+Run from the repository root with
+
+.. code:: bash
+
+    python benchmarks/bench_native_format.py [n_samples ...] [--dir DIRECTORY]
+
+(default sizes 1e6 and 1e7 samples). The files are written in a temporary directory, or in DIRECTORY if given:
+sizes of 1e8 samples and above need several GB of free disk, and some more RAM for the HDFStore side.
+
+HDFStore is used as in :func:`neuroseries.store` (fixed format, one key per object). Loading from the native
+format maps the files without reading them, so the load time is also given including a full pass over the
+data (a sum), which reads the data from disk (or from the page cache on a second run).
+"""
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+import numpy as np
+import pandas as pd
+
+import neuroseries as nts
+
+
+def make_objects(n):
+    rng = np.random.RandomState(0)
+    t = np.cumsum(rng.randint(1, 100, n)).astype(np.int64)
+    return (
+        ('Tsd', nts.Tsd(t, rng.rand(n))),
+        ('TsdFrame', nts.TsdFrame(t, rng.rand(n, 4).astype(np.float32))),
+        ('IntervalSet', nts.IntervalSet.from_sorted_arrays(t[: n - n % 2].reshape((-1, 2)))),
+    )
+
+
+def to_pandas(data):
+    if isinstance(data, nts.Tsd):
+        return data.as_series()
+    return pd.DataFrame(data)
+
+
+def bench(stmt, number=3):
+    return min(timeit.repeat(stmt, number=1, repeat=number))
+
+
+def bench_formats(sizes, directory):
+    print('{:>11} {:>12} {:>10} {:>10} {:>10} {:>10} {:>12}'.format(
+        'n', 'class', 'h5 save', 'h5 load', 'nts save', 'nts load', 'nts load+sum'))
+    for n in sizes:
+        for name, data in make_objects(n):
+            h5_path = os.path.join(directory, name + '.h5')
+            nts_path = os.path.join(directory, name + '.nts')
+            df = to_pandas(data)
+
+            def h5_save():
+                with pd.HDFStore(h5_path, 'w') as store:
+                    store['data'] = df
+
+            def h5_load():
+                with pd.HDFStore(h5_path, 'r') as store:
+                    return store['data']
+
+            t_h5_save = bench(h5_save)
+            t_h5_load = bench(h5_load)
+            t_nts_save = bench(lambda: nts.save(data, nts_path))
+            t_nts_load = bench(lambda: nts.load(nts_path))
+            t_nts_sum = bench(lambda: np.asarray(nts.load(nts_path).values).sum())
+            print('{:>11} {:>12} {:>10.4f} {:>10.4f} {:>10.4f} {:>10.4f} {:>12.4f}'.format(
+                n, name, t_h5_save, t_h5_load, t_nts_save, t_nts_load, t_nts_sum))
+            os.remove(h5_path)
+            shutil.rmtree(nts_path)
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    out_dir = None
+    if '--dir' in args:
+        i = args.index('--dir')
+        out_dir = args[i + 1]
+        del args[i:i + 2]
+    n_samples = [int(float(a)) for a in args] or [10 ** 6, 10 ** 7]
+    tmp_dir = tempfile.mkdtemp(dir=out_dir)
+    try:
+        bench_formats(n_samples, tmp_dir)
+    finally:
+        shutil.rmtree(tmp_dir)
@@ -1,6 +1,8 @@
 from .interval_set import *
 from .time_series import *
 from .basic_computations import *
+from .streaming import *
+from .native_format import *
 from . import tests
 
 
@@ -1,22 +1,201 @@
 import pandas as pd
 import numpy as np
+from collections import namedtuple
 
 
-from .interval_set import IntervalSet
+from .time_series import TsdFrame, RegularTsdFrame, _to_us, _slices_index, _slices_labels, _time_axis
 
-def tsd_by_trial(data, events, window):
+
+def _window_bounds(data, events, window, time_units=None):
+    """
+    the event times (us) and the positions [lo, hi) of the samples in (event + window[0], event + window[1]]
+    """
+    ev = _to_us(events, time_units)
+    w = _to_us(window, time_units)
+    t = _time_axis(data)
+    lo = t.searchsorted(ev + w[0], side='right').astype(np.int64, copy=False)
+    hi = t.searchsorted(ev + w[1], side='right').astype(np.int64, copy=False)
+    return ev, w, lo, hi
+
+
+def tsd_by_trial(data, events, window, time_units=None):
     """
 
     Args:
         data: the data to be cut
         events: the events
         window: the interval around the events for cutting. Tuple (start, stop)
+        time_units: the time units of events and window
+
+    Returns:
+        the cut data as DataFrame, with the trial index ('interval'), the 'event_time' and the 'latency' of each
+        sample. Windows may overlap, the samples in several windows appearing once for each.
+    """
+    ev, _, lo, hi = _window_bounds(data, events, window, time_units)
+    sel = _slices_index(lo, hi)
+    labels = _slices_labels(lo, hi)
+    t = _time_axis(data)[sel]
+    values = np.asarray(data.values)[sel]
+    if values.ndim == 1:
+        columns = [data.name if data.name is not None else 0]
+    else:
+        columns = data.columns
+    data_by_trial = pd.DataFrame(values, index=t, columns=columns, copy=False)
+    data_by_trial['interval'] = labels
+    data_by_trial['event_time'] = ev[labels]
+    data_by_trial['latency'] = t - ev[labels]
+    return TsdFrame(data_by_trial)
+
+
+PeriEvent = namedtuple('PeriEvent', ['values', 'latency', 'offsets'])
+
+
+def _is_regular(data):
+    """
+    True for regularly sampled data, allowing for the 1 us truncation of sampling rates that do not divide 1 s
+    """
+    if isinstance(data, RegularTsdFrame):
+        return True
+    dt = np.diff(data.index.values)
+    return len(dt) == 0 or dt.max() - dt.min() <= 1
+
+
+def peri_event(data, events, window, time_units=None):
+    """
+    extracts the data around each event, as arrays.
+
+    For regularly sampled data (a RegularTsdFrame, or a Tsd/TsdFrame with a regular index) the epochs are
+    returned as a dense (n_events x n_samples x n_channels) tensor, each epoch having the n_samples samples
+    starting from the first sample after event + window[0], n_samples being the window duration divided by the
+    sampling interval. The epochs are read through a strided sliding-window view of the data, and the samples
+    falling outside the data are NaN.
+
+    Otherwise the epochs are returned in a ragged (CSR-style) layout: the samples in
+    (event + window[0], event + window[1]] of all events, concatenated, with the offsets of each event.
+
+    Windows may overlap.
+
+    Args:
+        data: a Tsd, TsdFrame or RegularTsdFrame
+        events: the event times
+        window: the interval around the events. Tuple (start, stop)
+        time_units: the time units of events and window
 
     Returns:
-        the cut data as DataFrame
+        a PeriEvent named tuple (values, latency, offsets):
+        dense - values (n_events, n_samples, n_channels), latency (n_events, n_samples) in us, offsets None
+        ragged - values (n, n_channels), latency (n,) in us, offsets (n_events + 1,) so that the samples of event
+        i are values[offsets[i]:offsets[i + 1]]
     """
-    intervals = IntervalSet(events + window[0], events + window[1])
-    data_by_trial = data.restrict(intervals, keep_labels=True)
-    data_by_trial['event_time'] = events[data_by_trial['interval']].values
-    data_by_trial['latency'] = data_by_trial.index.values - data_by_trial['event_time'].values
-    return data_by_trial
\ No newline at end of file
+    ev, w, lo, hi = _window_bounds(data, events, window, time_units)
+    values = np.asarray(data.values)
+    if values.ndim == 1:
+        values = values.reshape((-1, 1))
+    t = _time_axis(data)
+    n = len(t)
+
+    if not _is_regular(data):
+        offsets = np.zeros(len(ev) + 1, dtype=np.int64)
+        np.cumsum(hi - lo, out=offsets[1:])
+        sel = _slices_index(lo, hi)
+        labels = _slices_labels(lo, hi)
+        return PeriEvent(values[sel], t[sel] - ev[labels], offsets)
+
+    # the same sampling interval for a RegularTsdFrame and its as_tsdframe()
+    step = (int(t[n - 1]) - int(t[0])) / (n - 1) if n > 1 else 1.
+    # with a tolerance for the rounding of step, e.g. 1e6 / 30000
+    n_samples = int(np.floor((w[1] - w[0]) / step + 1e-6))
+    # the first sample of each epoch, on the sampling grid extended before the start and after the end of the data
+    k0 = lo.copy()
+    if n:
+        before = ev + w[0] < t[0]
+        k0[before] = 1 - np.ceil((t[0] - ev[before] - w[0]) / step - 1e-6).astype(np.int64)
+        after = ev + w[0] >= t[n - 1]
+        k0[after] = n + np.floor((ev[after] + w[0] - t[n - 1]) / step + 1e-6).astype(np.int64)
+    inside = (k0 >= 0) & (k0 + n_samples <= n)
+    dtype = values.dtype if inside.all() else np.result_type(values.dtype, np.float32)
+    epochs = np.empty((len(ev), n_samples, values.shape[1]), dtype=dtype)
+    if n >= n_samples > 0:
+        # (n - n_samples + 1, n_channels, n_samples) strided view of the data, without copy
+        windows = np.lib.stride_tricks.sliding_window_view(values, n_samples, axis=0)
+        epochs[inside] = windows[k0[inside]].transpose((0, 2, 1))
+    ix = k0[:, np.newaxis] + np.arange(n_samples)
+    ix_valid = np.clip(ix, 0, max(n - 1, 0))
+    if not inside.all():
+        # epochs overlapping the edges of the data, padded with NaN
+        partial = values[ix_valid[~inside]].astype(dtype) if n else np.full(epochs[~inside].shape, np.nan)
+        partial[ix[~inside] != ix_valid[~inside]] = np.nan
+        epochs[~inside] = partial
+    if n:
+        latency = np.asarray(t[ix_valid]) + ((ix - ix_valid) * step).astype(np.int64) - ev[:, np.newaxis]
+    else:
+        latency = np.zeros(ix.shape, dtype=np.int64)
+    return PeriEvent(epochs, latency, None)
+
+
+Peth = namedtuple('Peth', ['counts', 'mean', 'sem', 'bins'])
+
+
+def _trial_bin_counts(t, ev, start, bin_size, n_bins):
+    """
+    the (n_events, n_bins) spike counts of a sorted spike train in the bins (ev + start + k * bin_size,
+    ev + start + (k + 1) * bin_size]
+    """
+    lo = t.searchsorted(ev + start, side='right')
+    hi = t.searchsorted(ev + start + n_bins * bin_size, side='right')
+    sel = _slices_index(lo, hi)
+    labels = _slices_labels(lo, hi)
+    bins = (t[sel] - ev[labels] - start - 1) // bin_size
+    counts = np.bincount(labels * n_bins + bins, minlength=len(ev) * n_bins)
+    return counts.reshape((len(ev), n_bins)).astype(np.int32)
+
+
+def peth(ts_list, events, window, bin_size, time_units=None, max_workers=None):
+    """
+    Peri-event time histograms of many spike trains at once.
+
+    For each spike train, the spikes in the window of each event are found with two binary searches per event,
+    and are binned by their latency, so the cost does not depend on the number of bins. The spike trains are
+    processed concurrently in a thread pool.
+
+    Args:
+        ts_list: a list of spike trains (Ts/Tsd, or sorted arrays of times in us)
+        events: the event times
+        window: the interval around the events. Tuple (start, stop), the bins being (start + k * bin_size,
+        start + (k + 1) * bin_size] for k < (stop - start) / bin_size
+        bin_size: the bin duration
+        time_units: the time units of events, window and bin_size
+        max_workers: the number of threads (default: as in :py:class:`concurrent.futures.ThreadPoolExecutor`)
+
+    Returns:
+        a Peth named tuple (counts, mean, sem, bins): the (n_trains, n_events, n_bins) int32 spike counts, their
+        (n_trains, n_bins) mean and standard error of the mean across events, and the (n_bins + 1) bin edges
+        relative to the events, in us. Divide the counts by the bin size to get rates.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    ev = _to_us(events, time_units)
+    start, stop = _to_us(window, time_units)
+    bin_size = int(_to_us((bin_size,), time_units)[0])
+    if bin_size < 1:
+        raise ValueError('bin_size must be at least 1 us')
+    n_bins = int((stop - start) // bin_size)
+    times = [ts.index.values if hasattr(ts, 'index') else np.asarray(ts) for ts in ts_list]
+
+    counts = np.empty((len(times), len(ev), n_bins), dtype=np.int32)
+    mean = np.empty((len(times), n_bins))
+    sem = np.full((len(times), n_bins), np.nan)
+
+    def one_train(i):
+        c = _trial_bin_counts(times[i], ev, start, bin_size, n_bins)
+        counts[i] = c
+        # mean and variance from exact integer sums, squaring in int64 as int32 squares may overflow
+        c = c.astype(np.int64)
+        total = c.sum(axis=0)
+        mean[i] = total / len(ev)
+        if len(ev) > 1:
+            squares = (c * c).sum(axis=0)
+            sem[i] = np.sqrt((squares - total * mean[i]) / (len(ev) - 1) / len(ev))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(one_train, range(len(times))))
+    return Peth(counts, mean, sem, start + bin_size * np.arange(n_bins + 1, dtype=np.int64))
@@ -1,7 +1,101 @@
 import pandas as pd
 import numpy as np
 from warnings import warn
-from .time_series import TimeUnits, Range
+from .time_series import TimeUnits, Range, _get_times, store, _as_interval_set, _time_axis, _RegularTimes
+
+
+def _interval_labels(start, end, t, return_mask=False):
+    """
+    labels each time in t with the index of the (sorted, non-overlapping) interval containing it, -1 if none.
+
+    :param start: the sorted interval starts
+    :param end: the sorted interval ends
+    :param t: the times to be labeled
+    :param return_mask: if True, also returns the boolean mask of the labeled points
+    :return: an int64 label array, and optionally the mask
+    """
+    # the only candidate is the first interval ending at or after t, it contains t if it starts before t
+    labels = np.searchsorted(end, t, side='left').astype(np.int64, copy=False)
+    mask = np.searchsorted(start, t, side='left') > labels
+    labels[~mask] = -1
+    if return_mask:
+        return labels, mask
+    return labels
+
+
+def _sweep(bounds, weights, dtype=np.int32):
+    """
+    sweep-line over a group of interval sets.
+
+    The boundaries of each set are already sorted, so the stable sort of their concatenation reduces to a merge
+    of the sorted runs.
+    :param bounds: list of arrays with the interleaved boundaries (start_0, end_0, start_1, end_1, ...) of each set
+    :param weights: the weight of each set in the coverage count
+    :param dtype: the integer type of the coverage
+    :return: the sorted unique boundaries t, and the weighted coverage of the segments (t[k], t[k+1])
+    """
+    t = np.concatenate(bounds)
+    delta = np.empty(len(t), dtype=dtype)
+    pos = 0
+    for b, w in zip(bounds, weights):
+        delta[pos:pos + len(b):2] = w
+        delta[pos + 1:pos + len(b):2] = -w
+        pos += len(b)
+    order = np.argsort(t, kind='stable')
+    t = t[order]
+    cov = np.cumsum(delta[order], dtype=dtype)
+    # only the coverage after the last of a group of equal boundaries spans a non-empty segment
+    last = np.empty(len(t), dtype=bool)
+    last[-1:] = True
+    np.not_equal(t[1:], t[:-1], out=last[:-1])
+    return t[last], cov[last]
+
+
+def _values(i_set):
+    """
+    the (n, 2) array of the [start, end] rows of an IntervalSet (or of a materialized LazyIntervalSet)
+    """
+    i_set = _as_interval_set(i_set)
+    if len(i_set.columns) == 2 and i_set.columns[0] == 'start':
+        return i_set.values
+    return i_set[['start', 'end']].values
+
+
+def _bounds(i_set):
+    """
+    the interleaved boundaries (start_0, end_0, start_1, end_1, ...) of an IntervalSet
+    """
+    return _values(i_set).ravel()
+
+
+def _runs(t, keep):
+    """
+    start and end of the maximal runs of elementary segments that belong to the result of a sweep.
+
+    :param t: sorted unique boundaries
+    :param keep: boolean array, True if the segment (t[k], t[k+1]) belongs to the result
+    :return: the (n, 2) array of the [start, end] rows of the resulting intervals
+    """
+    # keep switches on at the start of each run and off at its end
+    edges = np.flatnonzero(np.diff(keep, prepend=False))
+    return t[edges].reshape((-1, 2))
+
+
+def _same_times(u, t):
+    """
+    True if two time axes (arrays, or RegularTsdFrame time axes) hold the same times
+    """
+    if isinstance(u, _RegularTimes) or isinstance(t, _RegularTimes):
+        return isinstance(u, _RegularTimes) and isinstance(t, _RegularTimes) and \
+            (u.t0, u.fs, u.n) == (t.t0, t.fs, t.n)
+    return len(u) == len(t) and (len(t) == 0 or (u[0] == t[0] and u[-1] == t[-1])) and np.array_equal(u, t)
+
+
+def _format_duration(threshold, time_units):
+    """
+    converts a duration to the standard neuroseries time format
+    """
+    return TimeUnits.format_timestamps(np.array((threshold,), dtype=np.float64), time_units)[0]
 
 
 # noinspection PyAbstractClass
@@ -28,7 +122,7 @@ class IntervalSet(pd.DataFrame):
             if 'start' not in df.columns or 'end' not in df.columns:
                 raise ValueError('wrong columns')
             super().__init__(df, **kwargs)
-            self.r_cache = None
+            self.lookup_cache = None
             self._metadata = ['nts_class']
             self.nts_class = self.__class__.__name__
             return
@@ -80,10 +174,42 @@ class IntervalSet(pd.DataFrame):
         # self = self[['start', 'end']]
         data = np.vstack((start, end)).T
         super().__init__(data=data, columns=('start', 'end'), **kwargs)
-        self.r_cache = None
+        self.lookup_cache = None
         self._metadata = ['nts_class']
         self.nts_class = self.__class__.__name__
 
+    @classmethod
+    def from_sorted_arrays(cls, start, end=None, validate=False):
+        """
+        makes an IntervalSet from data that are already a valid interval set in the standard neuroseries time
+        format (int64 microseconds): sorted, with start[i] <= end[i] and end[i] <= start[i+1].
+
+        Unlike the regular constructor, there is no time unit conversion, no sorting and no attempt to fix the
+        data. An (n, 2) int64 array is wrapped without copy.
+        :param start: array containing the beginning of each interval. If end is None, then it is taken to be
+        an (n, 2) array with the start and end of each interval as rows.
+        :param end: array containing the end of each interval
+        :param validate: if True, checks that the data are a valid interval set, raising ValueError otherwise
+        :return: the IntervalSet
+        """
+        if end is None:
+            data = np.asarray(start)
+            if data.ndim != 2 or data.shape[1] != 2:
+                raise ValueError('data must be an (n, 2) array')
+        else:
+            if len(start) != len(end):
+                raise ValueError('start and end not of the same length')
+            data = np.column_stack((start, end))
+        data = data.astype(np.int64, copy=False)
+
+        if validate:
+            if (data[:, 0] > data[:, 1]).any():
+                raise ValueError('some ends precede the relative start')
+            if (data[:-1, 1] > data[1:, 0]).any():
+                raise ValueError('some start precede the previous end')
+
+        return cls(pd.DataFrame(data=data, columns=('start', 'end'), copy=False))
+
     def time_span(self):
         """
         Time span of the interval set.
@@ -111,29 +237,9 @@ class IntervalSet(pd.DataFrame):
         :param a: the IntervalSet to intersect self with, or a tuple of
         :return: the intersection IntervalSet
         """
-
         i_sets = [self]
         i_sets.extend(a)
-        n_sets = len(i_sets)
-        time1 = [i_set['start'] for i_set in i_sets]
-        time2 = [i_set['end'] for i_set in i_sets]
-        time1.extend(time2)
-        time = np.hstack(time1)
-
-        start_end = np.hstack((np.ones(len(time)//2, dtype=np.int32),
-                              -1 * np.ones(len(time)//2, dtype=np.int32)))
-
-        df = pd.DataFrame({'time': time, 'start_end': start_end})
-        df.sort_values(by='time', inplace=True)
-        df.reset_index(inplace=True, drop=True)
-        df['cumsum'] = df['start_end'].cumsum()
-        # noinspection PyTypeChecker
-        ix = np.nonzero(df['cumsum'] == n_sets)[0]
-        start = df['time'][ix]
-        # noinspection PyTypeChecker
-        end = df['time'][ix+1]
-
-        return IntervalSet(start, end)
+        return intersect_all(i_sets)
 
     def union(self, *a):
         """
@@ -144,23 +250,7 @@ class IntervalSet(pd.DataFrame):
         """
         i_sets = [self]
         i_sets.extend(a)
-        time = np.hstack([i_set['start'] for i_set in i_sets] +
-                         [i_set['end'] for i_set in i_sets])
-
-        start_end = np.hstack((np.ones(len(time)//2, dtype=np.int32),
-                              -1 * np.ones(len(time)//2, dtype=np.int32)))
-
-        df = pd.DataFrame({'time': time, 'start_end': start_end})
-        df.sort_values(by='time', inplace=True)
-        df.reset_index(inplace=True, drop=True)
-        df['cumsum'] = df['start_end'].cumsum()
-        # noinspection PyTypeChecker
-        ix_stop = np.nonzero(df['cumsum'] == 0)[0]
-        ix_start = np.hstack((0, ix_stop[:-1]+1))
-        start = df['time'][ix_start]
-        stop = df['time'][ix_stop]
-
-        return IntervalSet(start, stop)
+        return union_all(i_sets)
 
     def set_diff(self, a):
         """
@@ -169,41 +259,79 @@ class IntervalSet(pd.DataFrame):
         :param a: the interval set to set-subtract from self
         :return: the difference IntervalSet
         """
-        i_sets = (self, a)
-        time = np.hstack([i_set['start'] for i_set in i_sets] +
-                         [i_set['end'] for i_set in i_sets])
-        start_end1 = np.hstack((np.ones(len(i_sets[0]), dtype=np.int32),
-                                -1 * np.ones(len(i_sets[0]), dtype=np.int32)))
-        start_end2 = np.hstack((-1 * np.ones(len(i_sets[1]), dtype=np.int32),
-                                np.ones(len(i_sets[1]), dtype=np.int32)))
-        start_end = np.hstack((start_end1, start_end2))
-        df = pd.DataFrame({'time': time, 'start_end': start_end})
-        df.sort_values(by='time', inplace=True)
-        df.reset_index(inplace=True, drop=True)
-        df['cumsum'] = df['start_end'].cumsum()
-        # noinspection PyTypeChecker
-        ix = np.nonzero(df['cumsum'] == 1)[0]
-        start = df['time'][ix]
-        # noinspection PyTypeChecker
-        end = df['time'][ix+1]
-
-        return IntervalSet(start, end)
-
-    def in_interval(self, tsd):
+        # with weight 2 for a, coverage 1 means in self and not in a
+        t, cov = _sweep([_bounds(self), _bounds(a)], [1, 2])
+        return IntervalSet.from_sorted_arrays(_runs(t, cov == 1))
+
+    def in_interval(self, tsd, return_mask=False):
         """
         finds out in which element of the interval set each point in a time series fits.
 
-        NaNs for those
-        that don't fit a interval
-        :param tsd: the tsd to be binned
-        :return: an array with the interval index labels for each time stamp (NaN) for timestamps not in
-        IntervalSet.
+        A point t belongs to interval i if start[i] < t <= end[i]. The labels are computed with two
+        binary searches against the (sorted) start and end columns, so the cost is O(n log m) for n time
+        points and m intervals.
+        :param tsd: the tsd to be binned (or an array of timestamps)
+        :param return_mask: if True, also returns a boolean mask of the points falling in the IntervalSet
+        :return: an int64 array with the interval index labels for each time stamp (-1 for timestamps not in
+        IntervalSet). If return_mask is True, a tuple (labels, mask).
         """
-        bins = self.values.ravel()
-        ix = np.array(pd.cut(tsd.index, bins, labels=np.arange(len(bins) - 1, dtype=np.float64)))
-        ix[np.floor(ix / 2) * 2 != ix] = np.NaN
-        ix = np.floor(ix/2)
-        return ix
+        t = tsd.index.values if hasattr(tsd, 'index') else np.asarray(tsd)
+        return _interval_labels(self['start'].values, self['end'].values, t, return_mask=return_mask)
+
+    def restrict_many(self, data, keep_labels=False, max_workers=None):
+        """
+        Restricts many Tsd/TsdFrame/RegularTsdFrame's to the IntervalSet, as their restrict method would do.
+
+        The slice bounds of the intervals are computed once for all the objects sharing the same time index (the
+        same index object or RegularTsdFrame time axis, or one with the same content), and the objects are
+        processed concurrently in a thread pool.
+        :param data: a list of Tsd/TsdFrame/RegularTsdFrame's
+        :param keep_labels: if True, a column is added with the index of the interval in the interval_set in which
+        each point falls.
+        :param max_workers: the number of threads (default: as in :py:class:`concurrent.futures.ThreadPoolExecutor`)
+        :return: a list with the restricted objects
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        data = list(data)
+
+        # objects with the same time index share the slice bounds
+        times = []
+        by_index = {}
+        groups = []
+        for d in data:
+            # the index object (or time axis) is kept alive by d, so that its id is not reused during the call
+            t = _time_axis(d)
+            key = id(t) if isinstance(t, _RegularTimes) else id(d.index)
+            if key not in by_index:
+                for j, u in enumerate(times):
+                    if _same_times(u, t):
+                        by_index[key] = j
+                        break
+                else:
+                    by_index[key] = len(times)
+                    times.append(t)
+            groups.append(by_index[key])
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            bounds = list(executor.map(self.slice_bounds, times))
+            # noinspection PyProtectedMember
+            return list(executor.map(lambda d, j: d._restrict_slices(*bounds[j], keep_labels), data, groups))
+
+    def slice_bounds(self, tsd):
+        """
+        finds the positions of the points of a time series falling in each interval (start < t <= end).
+
+        Since the time index is sorted, the points in interval i are the contiguous slice lo[i]:hi[i]. The bounds
+        are found with binary searches, in O(m log n) for m intervals and n time points.
+        :param tsd: the tsd to be sliced (or a RegularTsdFrame, or a sorted array of timestamps)
+        :return: a tuple (lo, hi) of int64 arrays
+        """
+        t = tsd.index.values if isinstance(tsd, (pd.Series, pd.DataFrame)) else tsd
+        if not hasattr(t, 'searchsorted'):
+            t = np.asarray(t)
+        lo = t.searchsorted(self['start'].values, side='right').astype(np.int64, copy=False)
+        hi = t.searchsorted(self['end'].values, side='right').astype(np.int64, copy=False)
+        return lo, hi
 
     def drop_short_intervals(self, threshold, time_units=None):
         """
@@ -216,8 +344,9 @@ class IntervalSet(pd.DataFrame):
         :return: a copied IntervalSet with the dropped intervals
         :rtype: neuroseries.interval_set.IntervalSet
         """
-        threshold = TimeUnits.format_timestamps(np.array((threshold,), dtype=np.int64).ravel(), time_units)[0]
-        return self.loc[(self['end']-self['start']) > threshold]
+        threshold = _format_duration(threshold, time_units)
+        data = _values(self)
+        return IntervalSet.from_sorted_arrays(data[(data[:, 1] - data[:, 0]) > threshold])
 
     def as_units(self, units=None):
         """
@@ -232,27 +361,44 @@ class IntervalSet(pd.DataFrame):
 
         return df
 
-    def merge_close_intervals(self, threshold, time_units=None):
+    def merge_close_intervals(self, threshold, time_units=None, drop_threshold=None):
         """
         Merges intervals that are very close.
 
+        Gaps no longer than threshold are closed in a single pass over the sorted intervals. If drop_threshold
+        is given, the merged intervals no longer than drop_threshold are dropped in the same pass, as
+        :py:meth:`drop_short_intervals` would do.
         :param threshold: time threshold for the closeness of the intervals
-        :param time_units: time units for the threshold
+        :param time_units: time units for the thresholds
+        :param drop_threshold: time threshold for "short" intervals to be dropped after merging (default: None,
+        nothing is dropped)
         :return: a copied IntervalSet with merged intervals
         """
-        if len(self) == 0:
-            return IntervalSet(start=[], end=[])
-        tsp = self.time_span()
-        i1 = tsp.set_diff(self)
-        i1 = i1.drop_short_intervals(threshold, time_units=time_units)
-        return tsp.set_diff(i1)
-
-    def store(self, the_store, key, **kwargs):
-        data_to_store = pd.DataFrame(self)
-        the_store[key] = data_to_store
-        # noinspection PyProtectedMember
-        metadata = {k: getattr(self, k) for k in self._metadata}
-        the_store.put(key, data_to_store, metadata, **kwargs)
+        threshold = _format_duration(threshold, time_units)
+        data = _values(self)
+        if len(data) == 0:
+            return IntervalSet.from_sorted_arrays(np.empty((0, 2), dtype=np.int64))
+
+        # an interval starts after each gap that is kept, and ends before it
+        keep_gap = (data[1:, 0] - data[:-1, 1]) > threshold
+        first = np.empty(len(data), dtype=bool)
+        first[0] = True
+        first[1:] = keep_gap
+        last = np.empty(len(data), dtype=bool)
+        last[-1] = True
+        last[:-1] = keep_gap
+        start = data[first, 0]
+        end = data[last, 1]
+
+        if drop_threshold is not None:
+            keep = (end - start) > _format_duration(drop_threshold, time_units)
+            start = start[keep]
+            end = end[keep]
+
+        return IntervalSet.from_sorted_arrays(start, end)
+
+    def store(self, the_store, key, append=False, **kwargs):
+        store(self, the_store, key, append=append, **kwargs)
 
     @property
     def _constructor(self):
@@ -268,16 +414,39 @@ class IntervalSet(pd.DataFrame):
 
 
         """
-        if Range.interval is None:
-            raise ValueError('no window interval set')
-        if self.r_cache is None:
-            self.r_cache = self.intersect(Range.interval)
-            Range.cached_objects.append(self)
+        return Range.restricted(self, lambda data, interval: data.intersect(interval))
 
-        return self.r_cache
+    @property
+    def r_cache(self):
+        return Range.cache.peek(self, Range.interval)
 
     def invalidate_restrict_cache(self):
-        self.r_cache = None
+        Range.cache.discard_object(self)
+
+    def lazy(self):
+        """
+        A lazy version of the IntervalSet, recording the set operations applied to it and computing them only when
+        needed, see :py:class:`LazyIntervalSet`.
+
+        :return: a LazyIntervalSet wrapping self
+        """
+        return LazyIntervalSet('leaf', (), result=self)
+
+    @property
+    def interval_lookup(self):
+        """
+        An :py:class:`IntervalLookup` for fast stabbing and overlap queries on the IntervalSet (property,
+        read-only).
+
+        It is built at the first access and cached. The cache is not updated if the IntervalSet is modified in
+        place, in that case call :py:meth:`invalidate_lookup_cache`.
+        """
+        if self.lookup_cache is None:
+            self.lookup_cache = IntervalLookup(self['start'].values, self['end'].values)
+        return self.lookup_cache
+
+    def invalidate_lookup_cache(self):
+        self.lookup_cache = None
 
     # def __iter__(self):
     #     self.iter_r = self.iterrows()
@@ -286,3 +455,248 @@ class IntervalSet(pd.DataFrame):
     # def __next__(self):
     #     n = next(self.iter_r)[1]
     #     return IntervalSet(n['start'], n['end'])
+
+
+class IntervalLookup:
+    """
+    An index over the (sorted, non-overlapping) intervals of an :py:class:`IntervalSet`, answering batched
+    stabbing and overlap queries with binary searches, in O(log n + k) per query.
+
+    Query times are given in the standard neuroseries format (int64 microseconds), or as pandas objects, whose
+    index is then used. It is normally obtained through :py:attr:`IntervalSet.interval_lookup`:
+
+    .. code:: python
+
+        ix = epochs.interval_lookup.stab(events)
+        offsets, ix = epochs.interval_lookup.overlapping(win_start, win_end)
+    """
+    def __init__(self, start, end):
+        self.start = np.ascontiguousarray(start)
+        self.end = np.ascontiguousarray(end)
+
+    def __len__(self):
+        return len(self.start)
+
+    def stab(self, t):
+        """
+        finds the interval containing each time, with the same convention as
+        :py:meth:`IntervalSet.in_interval` (start < t <= end).
+
+        :param t: the query times
+        :return: an int64 array with the index of the interval containing each time, -1 if none
+        """
+        return _interval_labels(self.start, self.end, _get_times(t))
+
+    def overlapping(self, start, end):
+        """
+        finds the intervals overlapping each of a set of windows [start, end], that is sharing a segment of
+        non-zero length with it.
+
+        :param start: the window starts
+        :param end: the window ends
+        :return: a tuple (offsets, indices) in compressed sparse row layout: the intervals overlapping window j
+        are indices[offsets[j]:offsets[j + 1]], in increasing order.
+        """
+        start = _get_times(start)
+        end = _get_times(end)
+        if len(start) != len(end):
+            raise ValueError('start and end not of the same length')
+        first = np.searchsorted(self.end, start, side='right')
+        stop = np.searchsorted(self.start, end, side='left')
+        counts = np.maximum(stop - first, 0)
+        offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        indices = np.arange(offsets[-1], dtype=np.int64)
+        indices -= np.repeat(offsets[:-1] - first, counts)
+        return offsets, indices
+
+
+class LazyIntervalSet:
+    """
+    A lazy expression over :py:class:`IntervalSet`'s, obtained with :py:meth:`IntervalSet.lazy`.
+
+    Set operations are recorded and fused, and computed only by :py:meth:`compute` or when a restrict needs the
+    intervals. Chains of set operations (up to 62 distinct inputs) are evaluated in a single sweep over all the
+    input boundaries, so that no intermediate IntervalSet is materialized:
+
+    .. code:: python
+
+        epochs = sleep.lazy().intersect(theta).set_diff(artifacts).union(extra).merge_close_intervals(1000)
+        tsd_r = tsd.restrict(epochs)
+    """
+    max_fused = 62
+
+    def __init__(self, op, children, params=None, result=None):
+        self.op = op
+        self.children = children
+        self.params = params
+        self.result = result
+
+    @staticmethod
+    def _wrap(a):
+        if isinstance(a, LazyIntervalSet):
+            return a
+        return a.lazy()
+
+    def _nary(self, op, a):
+        children = []
+        for node in (self,) + tuple(LazyIntervalSet._wrap(i) for i in a):
+            if node.op == op and node.result is None:
+                children.extend(node.children)
+            else:
+                children.append(node)
+        return LazyIntervalSet(op, children)
+
+    def intersect(self, *a):
+        """
+        lazy set intersection
+
+        :param a: the IntervalSet's (or LazyIntervalSet's) to intersect self with
+        :return: a LazyIntervalSet
+        """
+        return self._nary('intersect', a)
+
+    def union(self, *a):
+        """
+        lazy set union
+
+        :param a: the IntervalSet's (or LazyIntervalSet's) to unite self with
+        :return: a LazyIntervalSet
+        """
+        return self._nary('union', a)
+
+    def set_diff(self, a):
+        """
+        lazy set difference. Consecutive differences are fused: (x - y) - a is recorded as x - (y | a)
+
+        :param a: the IntervalSet (or LazyIntervalSet) to set-subtract from self
+        :return: a LazyIntervalSet
+        """
+        a = LazyIntervalSet._wrap(a)
+        if self.op == 'set_diff' and self.result is None:
+            return LazyIntervalSet('set_diff', [self.children[0], self.children[1].union(a)])
+        return LazyIntervalSet('set_diff', [self, a])
+
+    def merge_close_intervals(self, threshold, time_units=None, drop_threshold=None):
+        """
+        lazy version of :py:meth:`IntervalSet.merge_close_intervals`
+        """
+        return LazyIntervalSet('merge_close_intervals', [self],
+                               dict(threshold=threshold, time_units=time_units, drop_threshold=drop_threshold))
+
+    def drop_short_intervals(self, threshold, time_units=None):
+        """
+        lazy version of :py:meth:`IntervalSet.drop_short_intervals`
+        """
+        return LazyIntervalSet('drop_short_intervals', [self], dict(threshold=threshold, time_units=time_units))
+
+    def compute(self):
+        """
+        materializes the expression. The result is cached in the node.
+
+        :return: the resulting IntervalSet
+        """
+        if self.result is None:
+            if self.op in ('intersect', 'union', 'set_diff'):
+                self.result = self._compute_set_op()
+            else:
+                self.result = getattr(self.children[0].compute(), self.op)(**self.params)
+        return self.result
+
+    def slice_bounds(self, tsd):
+        """
+        materializes the expression and calls :py:meth:`IntervalSet.slice_bounds` on the result
+        """
+        return self.compute().slice_bounds(tsd)
+
+    def restrict_many(self, data, keep_labels=False, max_workers=None):
+        """
+        materializes the expression and calls :py:meth:`IntervalSet.restrict_many` on the result
+        """
+        return self.compute().restrict_many(data, keep_labels=keep_labels, max_workers=max_workers)
+
+    def in_interval(self, tsd, return_mask=False):
+        """
+        materializes the expression and calls :py:meth:`IntervalSet.in_interval` on the result
+        """
+        return self.compute().in_interval(tsd, return_mask=return_mask)
+
+    def _collect_leaves(self, leaves):
+        """
+        the inputs of the sweep evaluating the set operations below this node: materialized nodes and other
+        operations
+        """
+        if self.result is not None or self.op not in ('intersect', 'union', 'set_diff'):
+            leaves.setdefault(id(self), (len(leaves), self))
+            return
+        for c in self.children:
+            c._collect_leaves(leaves)
+
+    def _mask(self, cov, leaves):
+        if id(self) in leaves:
+            return (cov >> leaves[id(self)][0]) & 1 == 1
+        masks = [c._mask(cov, leaves) for c in self.children]
+        if self.op == 'intersect':
+            return np.logical_and.reduce(masks)
+        if self.op == 'union':
+            return np.logical_or.reduce(masks)
+        return masks[0] & ~masks[1]
+
+    def _compute_set_op(self):
+        leaves = {}
+        self._collect_leaves(leaves)
+        if len(leaves) > LazyIntervalSet.max_fused:
+            i_sets = [c.compute() for c in self.children]
+            if self.op == 'intersect':
+                return intersect_all(i_sets)
+            if self.op == 'union':
+                return union_all(i_sets)
+            return i_sets[0].set_diff(i_sets[1])
+
+        # each input gets its own bit in the coverage, as intervals in an IntervalSet do not overlap
+        nodes = [node for _, node in sorted(leaves.values(), key=lambda x: x[0])]
+        bounds = [_bounds(node.compute()) for node in nodes]
+        t, cov = _sweep(bounds, [1 << j for j in range(len(nodes))], dtype=np.int64)
+        return IntervalSet.from_sorted_arrays(_runs(t, self._mask(cov, leaves)))
+
+
+def union_all(i_sets):
+    """
+    set union of many IntervalSet's
+
+    All the sets are merged in a single sweep. Since each set is sorted, the merge costs O(N log k) for N
+    boundaries in k sets.
+    :param i_sets: an iterable of IntervalSet's
+    :return: the union IntervalSet
+    """
+    return at_least_k(i_sets, 1)
+
+
+def intersect_all(i_sets):
+    """
+    set intersection of many IntervalSet's, computed in a single sweep
+
+    :param i_sets: an iterable of IntervalSet's
+    :return: the intersection IntervalSet
+    """
+    i_sets = list(i_sets)
+    if len(i_sets) == 0:
+        raise ValueError('intersection of an empty collection of IntervalSet\'s')
+    return at_least_k(i_sets, len(i_sets))
+
+
+def at_least_k(i_sets, k):
+    """
+    the times covered by at least k of the IntervalSet's, computed in a single sweep
+
+    :param i_sets: an iterable of IntervalSet's
+    :param k: the minimum number of sets covering each time
+    :return: the IntervalSet covered at least k times
+    """
+    if k < 1:
+        raise ValueError('k must be >= 1')
+    bounds = [_bounds(i_set) for i_set in i_sets]
+    if len(bounds) == 0:
+        return IntervalSet.from_sorted_arrays(np.empty((0, 2), dtype=np.int64))
+    t, cov = _sweep(bounds, [1] * len(bounds))
+    return IntervalSet.from_sorted_arrays(_runs(t, cov >= k))
@@ -0,0 +1,159 @@
+"""
+A native on-disk format for neuroseries objects: a directory holding the arrays of the object as raw
+little-endian binary files, and a small JSON header describing them.
+
+.. code:: text
+
+    data.nts/
+        header.json     {"format": "neuroseries", "version": 1, "nts_class": "TsdFrame", "time_units": "us",
+                         "columns": [...], "arrays": {"times": {"file": "times.bin", "dtype": "<i8", ...}, ...}}
+        times.bin       int64 times in us
+        data.bin        the data, (n samples x n columns) in row-major order
+
+A TsGroup is saved as its concatenated times and unit offsets, with the unit keys and metadata in the header.
+
+Loading maps the files read-only with :class:`numpy.memmap`, so that the data are wrapped without copy and read
+from disk only when accessed. Each array is saved with a single sequential write, and the header is written last.
+"""
+import json
+import os
+
+import pandas as pd
+import numpy as np
+
+from .time_series import Ts, Tsd, TsdFrame, RegularTsdFrame, TsGroup, microseconds, _ts_from_times
+from .interval_set import IntervalSet, _values
+
+FORMAT_VERSION = 1
+HEADER_FILE = 'header.json'
+
+
+def _write_array(path, name, a):
+    """
+    writes an array as a little-endian binary file, returning its description for the header
+    """
+    a = np.ascontiguousarray(a)
+    if a.dtype.hasobject:
+        raise ValueError('object arrays cannot be saved in the native format')
+    a = a.astype(a.dtype.newbyteorder('<'), copy=False)
+    file_name = name + '.bin'
+    with open(os.path.join(path, file_name), 'wb') as f:
+        a.tofile(f)
+    return {'file': file_name, 'dtype': a.dtype.str, 'shape': list(a.shape)}
+
+
+def _read_array(path, description, mmap_mode):
+    file_name = os.path.join(path, description['file'])
+    dtype = np.dtype(description['dtype'])
+    shape = tuple(description['shape'])
+    if mmap_mode is None or 0 in shape:
+        return np.fromfile(file_name, dtype=dtype).reshape(shape)
+    return np.memmap(file_name, dtype=dtype, mode=mmap_mode, shape=shape)
+
+
+def _columns(columns):
+    columns = list(columns)
+    try:
+        json.dumps(columns)
+    except TypeError:
+        raise ValueError('the column names must be JSON serializable')
+    return columns
+
+
+def _unit_metadata(metadata):
+    names = _columns(metadata.keys())
+    values = [list(v) for v in metadata.values()]
+    try:
+        json.dumps(values)
+    except TypeError:
+        raise ValueError('the unit metadata values must be JSON serializable')
+    return [list(item) for item in zip(names, values)]
+
+
+def save(data, path):
+    """
+    Saves a neuroseries object in the native format
+    Args:
+        data: a Ts, Tsd, TsdFrame, RegularTsdFrame, TsGroup or IntervalSet
+        path: the directory to write (created if needed, files already in it are overwritten)
+
+    Returns:
+        None
+    """
+    header = {'format': 'neuroseries', 'version': FORMAT_VERSION, 'nts_class': data.nts_class, 'time_units': 'us'}
+    arrays = {}
+    os.makedirs(path, exist_ok=True)
+    if isinstance(data, IntervalSet):
+        arrays['intervals'] = _write_array(path, 'intervals', _values(data).astype(np.int64, copy=False))
+    elif isinstance(data, TsGroup):
+        header['units'] = _columns(data.index)
+        header['metadata'] = _unit_metadata(data.unit_metadata)
+        arrays['times'] = _write_array(path, 'times', data.t)
+        arrays['offsets'] = _write_array(path, 'offsets', data.offsets)
+    elif isinstance(data, RegularTsdFrame):
+        header['fs'] = data.fs
+        header['t0'] = int(data.t0)
+        header['columns'] = _columns(data.columns)
+        arrays['data'] = _write_array(path, 'data', data.values)
+    elif isinstance(data, (Tsd, TsdFrame)):
+        arrays['times'] = _write_array(path, 'times', data.index.values.astype(np.int64, copy=False))
+        if isinstance(data, TsdFrame):
+            header['columns'] = _columns(data.columns)
+            dtypes = set(pd.DataFrame(data, copy=False).dtypes.values)
+            if len(dtypes) == 1:
+                arrays['data'] = _write_array(path, 'data', data.values)
+            else:
+                # columns of different types are saved separately
+                for i, c in enumerate(data.columns):
+                    arrays['data_' + str(i)] = _write_array(path, 'data_' + str(i), data[c].values)
+        elif not isinstance(data, Ts):
+            arrays['data'] = _write_array(path, 'data', data.values)
+    else:
+        raise TypeError('cannot save objects of type ' + type(data).__name__)
+    header['arrays'] = arrays
+    with open(os.path.join(path, HEADER_FILE), 'w') as f:
+        json.dump(header, f, indent=1)
+
+
+def load(path, mmap_mode='r'):
+    """
+    Loads a neuroseries object saved in the native format
+    Args:
+        path: the directory of the saved object
+        mmap_mode: the :class:`numpy.memmap` mode ('r' for read-only, 'c' for copy-on-write), or None to read
+        the arrays in memory
+
+    The times are stored in us, and are loaded as such whatever the default time units.
+
+    Returns:
+        the data as appropriate type, wrapping the memory-mapped arrays without copy (except for TsdFrame's with
+        columns of different types, that pandas copies into a single block per type)
+    """
+    with open(os.path.join(path, HEADER_FILE)) as f:
+        header = json.load(f)
+    if header.get('format') != 'neuroseries' or header.get('version', 0) > FORMAT_VERSION:
+        raise ValueError('not a neuroseries native file, or written by a newer version')
+    arrays = {k: _read_array(path, v, mmap_mode) for k, v in header['arrays'].items()}
+    nts_class = header['nts_class']
+
+    if nts_class == 'IntervalSet':
+        return IntervalSet.from_sorted_arrays(arrays['intervals'])
+    if nts_class == 'TsGroup':
+        return TsGroup.from_arrays(arrays['times'], arrays['offsets'], header['units'],
+                                   {c: v for c, v in header['metadata']})
+    if nts_class == 'RegularTsdFrame':
+        return RegularTsdFrame(arrays['data'], header['fs'], t0=header['t0'], columns=header['columns'],
+                               time_units=microseconds)
+    index = pd.Index(arrays['times'], copy=False)
+    if nts_class == 'Ts':
+        return _ts_from_times(arrays['times'])
+    if nts_class == 'Tsd':
+        return Tsd(pd.Series(arrays['data'], index=index, copy=False))
+    if nts_class == 'TsdFrame':
+        if 'data' in arrays:
+            df = pd.DataFrame(arrays['data'], index=index, columns=header['columns'], copy=False)
+        else:
+            df = pd.DataFrame({c: arrays['data_' + str(i)] for i, c in enumerate(header['columns'])},
+                              index=index)
+        return TsdFrame(df)
+    raise ValueError('unrecognized class ' + nts_class)
@@ -0,0 +1,200 @@
+import pandas as pd
+import numpy as np
+
+from .time_series import TimeUnits, _as_time_units, _as_interval_set, _time_axis, _segment, _gaps_above
+from .interval_set import IntervalSet
+
+
+def stream(source, chunk_duration, time_units=None):
+    """
+    iterates over a time series in chunks of fixed duration, so that computations can run on recordings that do
+    not fit in memory (for example a memory-mapped :func:`~neuroseries.time_series.TsdFrame.from_memmap`).
+
+    The chunks are the samples in consecutive windows [t0 + k * chunk_duration, t0 + (k + 1) * chunk_duration),
+    t0 being the time of the first sample. Empty windows are skipped. Only one chunk is materialized at a time.
+    :param source: a Tsd, TsdFrame or RegularTsdFrame
+    :param chunk_duration: the duration of the chunks
+    :param time_units: the time units of chunk_duration
+    :return: a generator of Tsd (for a Tsd source) or TsdFrame chunks
+    """
+    duration = TimeUnits.format_timestamps(np.array((chunk_duration,), dtype=np.float64),
+                                           _as_time_units(time_units))[0]
+    if duration <= 0:
+        raise ValueError('chunk_duration must be positive')
+    t = _time_axis(source)
+    n = len(t)
+    t0 = int(t[0]) if n else 0
+    lo = 0
+    while lo < n:
+        edge = t0 + ((int(t[lo]) - t0) // duration + 1) * duration
+        hi = int(t.searchsorted(edge, side='left'))
+        yield _segment(source, lo, hi)
+        lo = hi
+
+
+def restrict_stream(chunks, iset, keep_labels=False):
+    """
+    restricts each chunk of a stream to an IntervalSet, skipping the chunks that fall outside it. Intervals
+    spanning several chunks are split between them, and the labels are the positions in the whole IntervalSet.
+    :param chunks: an iterable of Tsd/TsdFrame chunks, as generated by :func:`stream`
+    :param iset: the restricting interval set
+    :param keep_labels: if True, a column is added with the index of the interval in the interval set in which
+    each point falls.
+    :return: a generator of the restricted chunks
+    """
+    iset = _as_interval_set(iset)
+    start = iset['start'].values
+    end = iset['end'].values
+    for chunk in chunks:
+        t = chunk.index.values
+        if len(t) == 0:
+            continue
+        # the intervals containing some point of the chunk, as a point t is in (start, end]
+        i0 = np.searchsorted(end, t[0], side='left')
+        i1 = np.searchsorted(start, t[-1], side='left')
+        if i1 <= i0:
+            continue
+        chunk_r = chunk.restrict(IntervalSet.from_sorted_arrays(start[i0:i1], end[i0:i1]),
+                                 keep_labels=keep_labels)
+        if len(chunk_r) == 0:
+            continue
+        if keep_labels:
+            chunk_r['interval'] = chunk_r['interval'].values + i0
+        yield chunk_r
+
+
+class _IntervalAccumulator:
+    """
+    collects the intervals found chunk by chunk, keeping only the arrays of the completed intervals
+    """
+    def __init__(self):
+        self.start = []
+        self.end = []
+
+    def add(self, start, end):
+        if len(start):
+            self.start.append(np.asarray(start, dtype=np.int64))
+            self.end.append(np.asarray(end, dtype=np.int64))
+
+    def result(self):
+        if not self.start:
+            return IntervalSet.from_sorted_arrays(np.empty((0, 2), dtype=np.int64))
+        return IntervalSet.from_sorted_arrays(np.concatenate(self.start), np.concatenate(self.end))
+
+
+class GapsAccumulator:
+    """
+    finds the gaps in a stream of chunks, with the same result as :func:`~neuroseries.time_series.Tsd.gaps`
+    with the 'absolute' method on the whole series. The last time of each chunk is kept, so that gaps across a
+    chunk edge are detected.
+
+    .. code:: python
+
+        gaps = nts.GapsAccumulator(1, time_units='s')
+        for chunk in nts.stream(data, 60, time_units='s'):
+            gaps.update(chunk)
+        gaps.result()
+    """
+    def __init__(self, min_gap, time_units=None):
+        """
+        :param min_gap: the minimum gap that will be considered (the 'median' method needs the whole series and
+        cannot be streamed)
+        :param time_units: the time units of min_gap
+        """
+        self.min_gap = min_gap * _as_time_units(time_units).conversion_factor
+        self.first = None
+        self.last = None
+        self.gaps = _IntervalAccumulator()
+
+    def update(self, chunk):
+        t = chunk.index.values
+        if len(t) == 0:
+            return
+        if self.last is None:
+            self.first = t[0]
+        else:
+            t = np.concatenate(((self.last,), t))
+        self.gaps.add(*_gaps_above(t, np.diff(t), self.min_gap))
+        self.last = t[-1]
+
+    def result(self):
+        """
+        :return: an IntervalSet containing the gaps found so far
+        """
+        return self.gaps.result()
+
+
+class SupportAccumulator(GapsAccumulator):
+    """
+    finds the support of a stream of chunks, with the same result as :func:`~neuroseries.time_series.Tsd.support`
+    with the 'absolute' method on the whole series. Support intervals spanning several chunks are joined, as
+    they are delimited by the gaps.
+    """
+    def result(self):
+        """
+        :return: an IntervalSet containing the support found so far
+        """
+        if self.last is None:
+            return IntervalSet.from_sorted_arrays(np.empty((0, 2), dtype=np.int64))
+        gaps = self.gaps.result().values
+        start = np.concatenate(((self.first - 1,), gaps[:, 1]))
+        end = np.concatenate((gaps[:, 0], (self.last + 1,)))
+        return IntervalSet.from_sorted_arrays(start, end)
+
+
+class ThresholdAccumulator:
+    """
+    finds the epochs in which a stream of chunks is above (or below) a threshold. Each epoch is
+    (t_first - 1, t_last], t_first and t_last being its first and last samples, so that restricting the data
+    to the result selects exactly the samples beyond the threshold. Epochs spanning several chunks are joined.
+    """
+    def __init__(self, threshold, method='above', column=None):
+        """
+        :param threshold: the threshold
+        :param method: 'above' (data > threshold) or 'below' (data < threshold)
+        :param column: the column of TsdFrame chunks to be thresholded, which can be omitted for a single column
+        """
+        if method == 'above':
+            self.compare = np.greater
+        elif method == 'below':
+            self.compare = np.less
+        else:
+            raise ValueError('unrecognized method')
+        self.threshold = threshold
+        self.column = column
+        self.open_start = None
+        self.last = None
+        self.epochs = _IntervalAccumulator()
+
+    def update(self, chunk):
+        t = chunk.index.values
+        if len(t) == 0:
+            return
+        if isinstance(chunk, pd.DataFrame):
+            if self.column is not None:
+                values = chunk[self.column].values
+            elif chunk.shape[1] == 1:
+                values = chunk.values[:, 0]
+            else:
+                raise ValueError('the column must be specified for multi-column data')
+        else:
+            values = chunk.values
+        beyond = self.compare(values, self.threshold).astype(np.int8)
+        edges = np.diff(beyond, prepend=np.int8(self.open_start is not None))
+        starts = t[np.flatnonzero(edges == 1)] - 1
+        ends = np.flatnonzero(edges == -1) - 1
+        ends = np.where(ends >= 0, t[ends], self.last if self.last is not None else 0)
+        if self.open_start is not None:
+            starts = np.concatenate(((self.open_start,), starts))
+        self.open_start = starts[-1] if beyond[-1] else None
+        self.epochs.add(starts[:len(ends)], ends)
+        self.last = t[-1]
+
+    def result(self):
+        """
+        :return: an IntervalSet containing the epochs found so far, the last one being closed at the last sample
+        """
+        epochs = self.epochs.result()
+        if self.open_start is None:
+            return epochs
+        return IntervalSet.from_sorted_arrays(np.vstack((epochs.values, ((self.open_start, self.last),))))
@@ -100,6 +100,44 @@ class TsTestCase(unittest.TestCase):
         with self.assertRaises(ValueError):
             t.times(units=nts.TimeUnits('banana'))
 
+    def test_create_ts_integer_exact(self):
+        """
+        integer timestamps are converted exactly, beyond the float64 precision
+        """
+        a = np.int64(2) ** 53 + np.arange(1, 200, 2, dtype=np.int64)
+        ts = nts.Ts(a)
+        np.testing.assert_array_equal(ts.index.values, a)
+        b = a // 1000
+        ts = nts.Ts(b, time_units=nts.milliseconds)
+        np.testing.assert_array_equal(ts.index.values, b * 1000)
+
+    def test_times_cache(self):
+        """
+        times are memoized per units until the index is replaced
+        """
+        a = np.random.randint(0, 10000000, 100)
+        a.sort()
+        t = nts.Tsd(a, np.random.randn(100))
+        self.assertIs(t.times(), t.times())
+        self.assertIsNot(t.times(), t.times(units=nts.milliseconds))
+        np.testing.assert_array_almost_equal_nulp(t.times(units=nts.milliseconds), a / 1000.)
+        self.assertFalse(t.times().flags.writeable)
+        t.index = a + 1
+        np.testing.assert_array_almost_equal_nulp(t.times(), a + 1)
+        self.assertEqual(t.start_time(units=nts.milliseconds), (a[0] + 1) / 1000.)
+        self.assertEqual(t.end_time(), a[-1] + 1)
+
+    def test_create_tsd_copies_times(self):
+        """
+        the index does not share memory with the array the times were given in
+        """
+        a = np.arange(0, 100, 10)
+        t = nts.Tsd(a, np.random.randn(10))
+        t.times()
+        a[0] = 5
+        self.assertEqual(t.index[0], 0)
+        self.assertEqual(t.times()[0], 0.)
+
 
 class TsRestrictTestCase(unittest.TestCase):
     def setUp(self):
@@ -168,6 +206,40 @@ class TsRestrictTestCase(unittest.TestCase):
         self.assertTrue((t_closest.values.ravel() != dt).sum() < 10)
         np.testing.assert_array_almost_equal_nulp(t_closest.values.ravel(), dt)
 
+    @parameterized.expand([
+        (nts.Tsd,),
+        (nts.TsdFrame,)
+    ])
+    def test_realign_tolerance(self, data_class):
+        """
+        realign with a maximum distance, duplicate timestamps and matched indices
+        """
+        t_a = data_class(np.array([100, 200, 200, 400]), np.array([1., 2., 3., 4.]))
+        t_b = nts.Ts(np.array([90, 150, 200, 210, 320, 500]))
+        t_closest, ix, dt = t_a.realign(t_b, align='closest', tolerance=30, return_indices=True)
+        np.testing.assert_array_equal(t_closest.index.values, t_b.index.values)
+        np.testing.assert_array_equal(ix, [0, -1, 1, 2, -1, -1])
+        np.testing.assert_array_equal(dt, [-10, 0, 0, 10, 0, 0])
+        np.testing.assert_array_equal(t_closest.values.ravel(), [1., np.nan, 2., 3., np.nan, np.nan])
+
+        t_prev = t_a.realign(t_b, align='prev')
+        np.testing.assert_array_equal(t_prev.values.ravel(), [np.nan, 1., 3., 3., 3., 4.])
+        t_next = t_a.realign(t_b, align='next', tolerance=0.1, time_units=nts.milliseconds)
+        np.testing.assert_array_equal(t_next.values.ravel(), [1., 2., 2., np.nan, 4., np.nan])
+
+    @parameterized.expand([
+        (nts.Tsd,),
+        (nts.TsdFrame,)
+    ])
+    def test_realign_empty(self, data_class):
+        t_a = data_class(np.array([], dtype=np.int64), np.array([], dtype=np.int16))
+        t_b = nts.Ts(np.array([90, 150, 200]))
+        realigned, ix, dt = t_a.realign(t_b, return_indices=True)
+        np.testing.assert_array_equal(realigned.index.values, t_b.index.values)
+        self.assertTrue(np.isnan(realigned.values).all())
+        np.testing.assert_array_equal(ix, [-1, -1, -1])
+        np.testing.assert_array_equal(dt, [0, 0, 0])
+
     @parameterized.expand([
         (nts.Tsd,),
         (nts.TsdFrame,)
@@ -221,6 +293,18 @@ class IntervalSetOpsTestCase(unittest.TestCase):
         np.testing.assert_array_almost_equal_nulp(np.array((100,)), int1['start'])
         np.testing.assert_array_almost_equal_nulp(np.array((2100,)), int1['end'])
 
+    def test_create_interval_set_from_sorted_arrays(self):
+        data = np.array([[100, 200], [300, 400], [400, 1000]], dtype=np.int64)
+        int1 = nts.IntervalSet.from_sorted_arrays(data)
+        self.assertIsInstance(int1, nts.IntervalSet)
+        self.assertTrue(np.shares_memory(int1.values, data))
+        np.testing.assert_array_equal(int1['start'], data[:, 0])
+        np.testing.assert_array_equal(int1['end'], data[:, 1])
+        int2 = nts.IntervalSet.from_sorted_arrays(data[:, 0], data[:, 1], validate=True)
+        np.testing.assert_array_equal(int2.values, data)
+        with self.assertRaises(ValueError):
+            nts.IntervalSet.from_sorted_arrays(data[::-1], validate=True)
+
     def test_iterator(self):
         a_i1 = self.mat_data1['a_i1'].ravel().astype(np.int64)
         b_i1 = self.mat_data1['b_i1'].ravel().astype(np.int64)
@@ -295,6 +379,120 @@ class IntervalSetOpsTestCase(unittest.TestCase):
         np.testing.assert_array_almost_equal_nulp(int_diff2['start'], a_diff2)
         np.testing.assert_array_almost_equal_nulp(int_diff2['end'], b_diff2)
 
+    def test_set_ops_touching(self):
+        """
+        touching intervals are merged by union and do not produce empty intervals in intersect or set_diff
+        """
+        int_a = nts.IntervalSet(0, 100)
+        int_b = nts.IntervalSet(100, 200)
+        int_union = int_a.union(int_b)
+        np.testing.assert_array_equal(int_union['start'], [0])
+        np.testing.assert_array_equal(int_union['end'], [200])
+        self.assertEqual(len(int_a.intersect(int_b)), 0)
+        int_diff = int_union.set_diff(nts.IntervalSet(50, 100))
+        np.testing.assert_array_equal(int_diff['start'], [0, 100])
+        np.testing.assert_array_equal(int_diff['end'], [50, 200])
+
+    def test_nary_ops(self):
+        """
+        union, intersection and k-coverage of many interval sets in one sweep
+        """
+        rng = np.random.RandomState(0)
+        i_sets = []
+        covered = np.zeros(100000, dtype=np.int64)
+        for i in range(20):
+            t = np.unique(rng.randint(0, 100000, 200))
+            t = t[:len(t) // 2 * 2]
+            i_sets.append(nts.IntervalSet(t[::2], t[1::2]))
+            for st, en in zip(t[::2], t[1::2]):
+                covered[st:en] += 1
+
+        def to_mask(i_set):
+            mask = np.zeros(100000, dtype=bool)
+            for st, en in zip(i_set['start'], i_set['end']):
+                mask[st:en] = True
+            return mask
+
+        np.testing.assert_array_equal(to_mask(nts.union_all(i_sets)), covered > 0)
+        np.testing.assert_array_equal(to_mask(nts.intersect_all(i_sets[:2])), to_mask(i_sets[0]) & to_mask(i_sets[1]))
+        np.testing.assert_array_equal(to_mask(nts.at_least_k(i_sets, 3)), covered >= 3)
+        int_union = i_sets[0].union(*i_sets[1:])
+        np.testing.assert_array_equal(int_union.values, nts.union_all(i_sets).values)
+        self.assertEqual(len(nts.union_all([])), 0)
+        with self.assertRaises(ValueError):
+            nts.intersect_all([])
+        with self.assertRaises(ValueError):
+            nts.at_least_k(i_sets, 0)
+
+    def test_lookup(self):
+        """
+        batched stabbing and overlap queries through the cached interval lookup
+        """
+        lookup = self.int1.interval_lookup
+        self.assertIs(lookup, self.int1.interval_lookup)
+        # the pandas DataFrame.lookup method is not hidden
+        self.assertTrue(callable(self.int1.lookup))
+        start = self.int1['start'].values
+        end = self.int1['end'].values
+        rng = np.random.RandomState(0)
+        t = rng.randint(start[0] - 1000, end[-1] + 1000, 1000)
+        np.testing.assert_array_equal(lookup.stab(t), self.int1.in_interval(t))
+
+        w_start = rng.randint(start[0] - 1000, end[-1], 200)
+        w_end = w_start + rng.randint(0, 50000, 200)
+        offsets, indices = lookup.overlapping(w_start, w_end)
+        self.assertEqual(len(offsets), len(w_start) + 1)
+        for j in range(len(w_start)):
+            expected = np.flatnonzero((start < w_end[j]) & (end > w_start[j]))
+            np.testing.assert_array_equal(indices[offsets[j]:offsets[j + 1]], expected)
+
+    def test_lazy(self):
+        """
+        lazy chains of set operations give the same result as the eager ones
+        """
+        rng = np.random.RandomState(1)
+        i_sets = []
+        for i in range(70):
+            t = np.unique(rng.randint(0, 10000000, 100))
+            t = t[:len(t) // 2 * 2]
+            i_sets.append(nts.IntervalSet(t[::2], t[1::2]))
+        a, b, c, d = i_sets[:4]
+
+        eager = a.intersect(b).set_diff(c).set_diff(d).union(b).merge_close_intervals(1000)
+        lazy = a.lazy().intersect(b).set_diff(c).set_diff(d).union(b).merge_close_intervals(1000)
+        self.assertIsInstance(lazy, nts.LazyIntervalSet)
+        np.testing.assert_array_equal(lazy.compute().values, eager.values)
+        self.assertIs(lazy.compute(), lazy.compute())
+
+        lazy_union = a.lazy().union(*i_sets[1:])
+        np.testing.assert_array_equal(lazy_union.compute().values, nts.union_all(i_sets).values)
+
+        tsd = nts.Tsd(np.arange(0, 10000000, 100), np.arange(100000.))
+        np.testing.assert_array_equal(tsd.restrict(lazy).index.values, tsd.restrict(eager).index.values)
+
+    def test_lazy_consumers(self):
+        """
+        the functions taking an IntervalSet accept a LazyIntervalSet
+        """
+        a = nts.IntervalSet([0, 3000000, 6000000], [2000000, 5000000, 9000000])
+        b = nts.IntervalSet([1000000, 4000000], [3500000, 8000000])
+        eager = a.intersect(b)
+        lazy = a.lazy().intersect(b)
+        tsd = nts.Tsd(np.arange(0, 10000000, 1000), np.arange(10000.))
+        ts = nts.Ts(np.arange(0, 10000000, 777))
+        self.assertEqual([s[:2] for s in tsd.split(lazy)], [s[:2] for s in tsd.split(eager)])
+        np.testing.assert_array_equal(ts.count(100000, lazy).values, ts.count(100000, eager).values)
+        group = nts.TsGroup([ts])
+        np.testing.assert_array_equal(group.restrict(lazy).t, group.restrict(eager).t)
+        np.testing.assert_array_equal(b.intersect(lazy).values, eager.values)
+        np.testing.assert_array_equal(b.set_diff(lazy).values, b.set_diff(eager).values)
+        restricted = list(nts.restrict_stream(nts.stream(tsd, 1000000), lazy))
+        np.testing.assert_array_equal(np.hstack([r.index.values for r in restricted]),
+                                      tsd.restrict(eager).index.values)
+        with nts.Range(lazy):
+            np.testing.assert_array_equal(a.r.values, eager.values)
+            np.testing.assert_array_equal(tsd.r.index.values, tsd.restrict(eager).index.values)
+
 
 class IntervalSetDropMergeTestCase(unittest.TestCase):
     def setUp(self):
@@ -330,6 +528,16 @@ class IntervalSetDropMergeTestCase(unittest.TestCase):
         np.testing.assert_array_almost_equal_nulp(i_merge['start'], self.a1_merge)
         np.testing.assert_array_almost_equal_nulp(i_merge['end'], self.b1_merge)
 
+    def test_merge_close_drop_short(self):
+        i_merge = self.int1.merge_close_intervals(threshold=3.e3, drop_threshold=5.e3)
+        i_expected = self.int1_merge.drop_short_intervals(threshold=5.e3)
+        self.assertIsInstance(i_merge, nts.IntervalSet)
+        np.testing.assert_array_equal(i_merge.values, i_expected.values)
+
+        i_merge_ms = self.int1.merge_close_intervals(threshold=3., time_units=nts.milliseconds,
+                                                     drop_threshold=5.)
+        np.testing.assert_array_equal(i_merge_ms.values, i_expected.values)
+
 
 class TsdUnitsTestCase(unittest.TestCase):
     def setUp(self):
@@ -397,6 +605,52 @@ class TsdUnitsTestCase(unittest.TestCase):
         # noinspection PyTypeChecker
         np.testing.assert_array_almost_equal_nulp(self.tsd_t/1.e6, tsd_s.index.values)
 
+    def test_units_context_nested(self):
+        with nts.TimeUnits('ms'):
+            with nts.TimeUnits('s'):
+                self.assertEqual(str(nts.TimeUnits.default_time_units), 's')
+            self.assertEqual(str(nts.TimeUnits.default_time_units), 'ms')
+        self.assertEqual(str(nts.TimeUnits.default_time_units), 'us')
+
+    def test_concurrent_contexts(self):
+        """
+        threads and asyncio tasks use their own time units and Range windows
+        """
+        import asyncio
+        import threading
+        from concurrent.futures import ThreadPoolExecutor
+        tsd = nts.Tsd(self.tsd_t, self.tsd_d)
+        units = ('us', 'ms', 's')
+        barrier = threading.Barrier(len(units))
+
+        def work(i):
+            u = units[i % len(units)]
+            window = nts.IntervalSet(self.tsd_t[10 * i], self.tsd_t[10 * i + 100])
+            with nts.TimeUnits(u), nts.Range(window):
+                barrier.wait(timeout=10)
+                for _ in range(20):
+                    t = tsd.r.times()
+                    np.testing.assert_array_equal(t, tsd.restrict(window).times(u))
+            return str(nts.TimeUnits.default_time_units), nts.Range.interval
+
+        with ThreadPoolExecutor(len(units)) as executor:
+            for r in executor.map(work, range(len(units))):
+                self.assertEqual(r, ('us', None))
+
+        async def task(u, window):
+            with nts.TimeUnits(u), nts.Range(window):
+                await asyncio.sleep(0)
+                return tsd.r.times(), tsd.restrict(window).times(u)
+
+        async def run():
+            return await asyncio.gather(*(task(u, nts.IntervalSet(self.tsd_t[i], self.tsd_t[i + 50]))
+                                          for i, u in enumerate(units)))
+
+        for t, expected in asyncio.run(run()):
+            np.testing.assert_array_equal(t, expected)
+        self.assertEqual(str(nts.TimeUnits.default_time_units), 'us')
+        self.assertIsNone(nts.Range.interval)
+
 
 class TsdSupportTestCase(unittest.TestCase):
     def setUp(self):
@@ -431,6 +685,30 @@ class TsdSupportTestCase(unittest.TestCase):
         np.testing.assert_array_almost_equal_nulp(support['start'], np.array((0, 799999, 5199999)))
         np.testing.assert_array_almost_equal_nulp(support['end'], np.array((499902, 2299901, 8899901)))
 
+    def test_gaps_median(self):
+        tsd = nts.Tsd(self.t, self.d)
+        gaps = tsd.gaps(5, method='median')
+        np.testing.assert_array_equal(gaps.values, [[499902, 799999], [2299901, 5199999]])
+        np.testing.assert_array_equal(tsd.support(5, method='median').values,
+                                      [[0, 499902], [799999, 2299901], [5199999, 8899901]])
+
+    def test_per_column(self):
+        d = np.column_stack((self.d, self.d, np.full(len(self.d), np.nan)))
+        # the second column drops out between 1000000 and 2000000
+        d[(self.t > 1000000) & (self.t < 2000000), 1] = np.nan
+        tsd = nts.TsdFrame(self.t, d, columns=['a', 'b', 'c'])
+        gaps = tsd.gaps(500, per_column=True)
+        support = tsd.support(500, per_column=True)
+        self.assertEqual(set(gaps), {'a', 'b', 'c'})
+        np.testing.assert_array_equal(gaps['a'].values, tsd.gaps(500).values)
+        np.testing.assert_array_equal(gaps['b'].values, [[499902, 799999], [1000001, 1999999], [2299901, 5199999]])
+        np.testing.assert_array_equal(support['b'].values,
+                                      [[0, 499902], [799999, 1000001], [1999999, 2299901], [5199999, 8899901]])
+        self.assertEqual(len(gaps['c']), 0)
+        self.assertEqual(len(support['c']), 0)
+        gaps = tsd.gaps(5, method='median', per_column=True)
+        np.testing.assert_array_equal(gaps['a'].values, tsd.gaps(5, method='median').values)
+
 
 class TsdIntervalSetRestrictTestCase(unittest.TestCase):
     def setUp(self):
@@ -476,6 +754,86 @@ class TsdIntervalSetRestrictTestCase(unittest.TestCase):
         np.testing.assert_array_almost_equal_nulp(t_r2, tsd_r2.times())
         np.testing.assert_array_almost_equal_nulp(d_r2, tsd_r2.values.ravel())
 
+    @parameterized.expand([
+        (nts.Tsd,),
+        (nts.TsdFrame,)
+    ])
+    def test_restrict_view(self, data_class):
+        """
+        restricting to a single interval gives a view, to several intervals a single gathered copy
+        """
+        self.tsd = data_class(self.tsd_t, self.tsd_d)
+        single = nts.IntervalSet(self.tsd_t[10], self.tsd_t[100])
+        tsd_r = self.tsd.restrict(single)
+        self.assertTrue(np.shares_memory(tsd_r.values, self.tsd.values))
+        _, in_set = single.in_interval(self.tsd, return_mask=True)
+        np.testing.assert_array_equal(tsd_r.index.values, self.tsd_t[in_set])
+
+        tsd_r = self.tsd.restrict(self.int1)
+        self.assertFalse(np.shares_memory(tsd_r.values, self.tsd.values))
+        _, in_set = self.int1.in_interval(self.tsd, return_mask=True)
+        np.testing.assert_array_equal(tsd_r.index.values, self.tsd_t[in_set])
+        np.testing.assert_array_equal(tsd_r.values.ravel(), self.tsd_d[in_set])
+
+    @parameterized.expand([
+        (nts.Tsd,),
+        (nts.TsdFrame,)
+    ])
+    def test_split(self, data_class):
+        """
+        iteration over the intervals of an IntervalSet, with zero-copy segments
+        """
+        self.tsd = data_class(self.tsd_t, self.tsd_d)
+        segments = list(self.tsd.split(self.int1))
+        self.assertEqual(len(segments), len(self.int1))
+        for i, (start, end, segment) in enumerate(segments):
+            self.assertEqual(start, self.int1['start'][i])
+            self.assertEqual(end, self.int1['end'][i])
+            self.assertIsInstance(segment, data_class)
+            expected = self.tsd.restrict(nts.IntervalSet(start, end))
+            np.testing.assert_array_equal(segment.index.values, expected.index.values)
+            if len(segment):
+                self.assertTrue(np.shares_memory(segment.values, self.tsd.values))
+
+        for (_, _, segment), (_, _, (t, d)) in zip(segments, self.tsd.split(self.int1, as_arrays=True)):
+            np.testing.assert_array_equal(t, segment.index.values)
+            np.testing.assert_array_equal(d, segment.values)
+
+    def test_restrict_many(self):
+        """
+        batched restrict of several objects, some of them sharing a time index
+        """
+        tsd_frame = nts.TsdFrame(self.tsd_t, np.vstack((self.tsd_d, -self.tsd_d)).T)
+        tsd_other = nts.Tsd(self.tsd_t[::3], self.tsd_d[::3])
+        tsd_copy = nts.Tsd(self.tsd_t.copy(), self.tsd_d.copy())
+        data = [self.tsd, tsd_frame, tsd_other, tsd_copy]
+        restricted = self.int1.restrict_many(data, max_workers=2)
+        self.assertEqual(len(restricted), len(data))
+        for d, d_r in zip(data, restricted):
+            expected = d.restrict(self.int1)
+            self.assertIsInstance(d_r, type(d))
+            np.testing.assert_array_equal(d_r.index.values, expected.index.values)
+            np.testing.assert_array_equal(d_r.values, expected.values)
+        labeled = self.int1.restrict_many(data, keep_labels=True)
+        np.testing.assert_array_equal(labeled[1]['interval'].values,
+                                      tsd_frame.restrict(self.int1, keep_labels=True)['interval'].values)
+
+    def test_in_interval(self):
+        """
+        integer labels of the interval containing each time point, -1 outside the IntervalSet
+        """
+        labels, mask = self.int1.in_interval(self.tsd, return_mask=True)
+        self.assertIs(labels.dtype, np.dtype(np.int64))
+        t = self.tsd.index.values
+        start = self.int1['start'].values
+        end = self.int1['end'].values
+        expected = np.full(len(t), -1, dtype=np.int64)
+        for i in range(len(start)):
+            expected[(t > start[i]) & (t <= end[i])] = i
+        np.testing.assert_array_equal(labels, expected)
+        np.testing.assert_array_equal(mask, expected >= 0)
+        np.testing.assert_array_equal(self.int1.in_interval(t), expected)
+
     @parameterized.expand([
         (nts.Tsd,),
         (nts.TsdFrame,)
@@ -511,5 +869,542 @@ class TsdIntervalSetRestrictTestCase(unittest.TestCase):
         with nts.Range(9.e8, 3.e9):
             np.testing.assert_array_almost_equal_nulp(self.tsd.r.times(), tsd_r.times())
 
+    def test_range_nested(self):
+        outer = nts.IntervalSet(9.e8, 3.e9)
+        inner = nts.IntervalSet(1.e9, 2.e9)
+        with nts.Range(outer):
+            tsd_outer = self.tsd.r
+            with nts.Range(inner):
+                np.testing.assert_array_equal(self.tsd.r.times(), self.tsd.restrict(inner).times())
+            self.assertIs(nts.Range.interval, outer)
+            self.assertIs(self.tsd.r, tsd_outer)
+        self.assertIsNone(nts.Range.interval)
+
+    def test_range_cache(self):
+        nts.Range.cache_clear()
+        info = nts.Range.cache_info()
+        range_interval = nts.IntervalSet(9.e8, 3.e9)
+        with nts.Range(range_interval):
+            self.tsd.r
+            self.tsd.r
+            self.assertEqual(nts.Range.cache_info().hits - info.hits, 1)
+            self.assertEqual(nts.Range.cache_info().misses - info.misses, 1)
+
+            # the cache does not keep the objects alive
+            tsd = nts.Tsd(self.tsd_t, self.tsd_d)
+            tsd.r
+            self.assertEqual(nts.Range.cache_info().entries, 2)
+            del tsd
+            self.assertEqual(nts.Range.cache_info().entries, 1)
+
+            # least recently used entries are evicted past the budget
+            budget = nts.Range.cache_info().max_bytes
+            try:
+                tsd_list = [nts.Tsd(self.tsd_t, self.tsd_d) for _ in range(3)]
+                for tsd in tsd_list:
+                    tsd.r
+                nts.Range.set_cache_budget(2 * nts.Range.cache_info().nbytes // 4)
+                self.assertEqual(nts.Range.cache_info().entries, 2)
+                self.assertIsNone(self.tsd.r_cache)
+                self.assertIsNotNone(tsd_list[-1].r_cache)
+            finally:
+                nts.Range.set_cache_budget(budget)
+        self.assertEqual(nts.Range.cache_info().entries, 0)
+
+    def test_range_cache_interval_reuse(self):
+        """
+        windows set through Range.interval and then dropped do not leave stale entries, even if their ids are reused
+        """
+        nts.Range.cache_clear()
+        try:
+            for i in range(200):
+                window = nts.IntervalSet(1.e9 + i * 1.e6, 2.e9)
+                nts.Range.interval = window
+                np.testing.assert_array_equal(self.tsd.r.index.values, self.tsd.restrict(window).index.values)
+                del window
+                nts.Range.interval = None
+            self.assertEqual(nts.Range.cache_info().entries, 0)
+        finally:
+            nts.Range.interval = None
+
+
+class RegularTsdFrameTestCase(unittest.TestCase):
+    def setUp(self):
+        self.fs = 1250.3
+        self.d = np.random.RandomState(0).rand(20000, 3)
+        self.reg = nts.RegularTsdFrame(self.d, self.fs, t0=17)
+        t = nts.TsdFrame(np.arange(len(self.d)), self.d, time_units=nts.TimeUnits(self.fs)).index.values + 17
+        self.ref = nts.TsdFrame(t, self.d)
+
+    def test_times(self):
+        np.testing.assert_array_equal(self.reg.index.values, self.ref.index.values)
+        np.testing.assert_array_equal(self.reg.times('ms'), self.ref.times('ms'))
+        self.assertEqual(self.reg.start_time(), self.ref.start_time())
+        self.assertEqual(self.reg.end_time('s'), self.ref.end_time('s'))
+        t = np.hstack((np.random.RandomState(1).randint(-1000, self.ref.index.values[-1] + 1000, 2000),
+                       self.ref.index.values[::7]))
+        for side in ('left', 'right'):
+            np.testing.assert_array_equal(self.reg.searchsorted(t, side),
+                                          np.searchsorted(self.ref.index.values, t, side))
+
+    def test_restrict_realign(self):
+        iset = nts.IntervalSet([1000, 3000000, 15000000], [2000000, 6000000, 15900000])
+        a = self.reg.restrict(iset, keep_labels=True)
+        b = self.ref.restrict(iset, keep_labels=True)
+        np.testing.assert_array_equal(a.index.values, b.index.values)
+        np.testing.assert_array_equal(a.values, b.values)
+
+        t = np.sort(np.random.RandomState(2).randint(0, 16000000, 500))
+        np.testing.assert_array_equal(self.reg.realign(t).values, self.ref.realign(t).values)
+        np.testing.assert_array_equal(self.reg.realign(t, align='prev').values,
+                                      self.ref.realign(t, align='prev').values)
+
+    def test_restrict_many_split(self):
+        iset = nts.IntervalSet([1000, 3000000, 15000000], [2000000, 6000000, 15900000])
+        other = nts.RegularTsdFrame(self.d[:, :1], self.fs, t0=17)
+        restricted = iset.restrict_many([self.reg, self.ref, other, self.reg], keep_labels=True)
+        for r in restricted:
+            expected = self.ref.restrict(iset, keep_labels=True)
+            np.testing.assert_array_equal(r.index.values, expected.index.values)
+            np.testing.assert_array_equal(r['interval'].values, expected['interval'].values)
+        np.testing.assert_array_equal(restricted[2].values[:, 0], restricted[1].values[:, 0])
+        for as_arrays in (False, True):
+            for (s0, e0, a), (s1, e1, b) in zip(self.reg.split(iset, as_arrays), self.ref.split(iset, as_arrays)):
+                self.assertEqual((s0, e0), (s1, e1))
+                if as_arrays:
+                    np.testing.assert_array_equal(a[0], b[0])
+                    np.testing.assert_array_equal(a[1], b[1])
+                else:
+                    self.assertIsInstance(a, nts.TsdFrame)
+                    np.testing.assert_array_equal(a.index.values, b.index.values)
+                    np.testing.assert_array_equal(a.values, b.values)
+
+    def test_store_extract(self):
+        import tempfile
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'reg.h5')
+            with pd.HDFStore(path, 'w') as store:
+                self.reg.store(store, 'reg')
+                with self.assertRaises(ValueError):
+                    nts.store(self.reg, store, 'reg', append=True)
+            with pd.HDFStore(path, 'r') as store:
+                extracted = nts.extract_from(store)['reg']
+        self.assertIsInstance(extracted, nts.RegularTsdFrame)
+        self.assertEqual((extracted.fs, extracted.t0), (self.reg.fs, self.reg.t0))
+        np.testing.assert_array_equal(extracted.values, self.d)
+        np.testing.assert_array_equal(extracted.index.values, self.ref.index.values)
+
+    def test_gaps_support(self):
+        self.assertEqual(len(self.reg.gaps(1000)), 0)
+        support = self.reg.support(1000)
+        np.testing.assert_array_equal(support.values, self.ref.support(1000).values)
+        np.testing.assert_array_equal(self.reg.gaps(100).values, self.ref.gaps(100).values)
+
+    def test_from_memmap(self):
+        import tempfile
+        d = (self.d * 1000).astype(np.int16)
+        reg = nts.RegularTsdFrame(d, self.fs, t0=17)
+        iset = nts.IntervalSet([1000, 3000000, 15000000], [2000000, 6000000, 15900000])
+        t = np.sort(np.random.RandomState(2).randint(0, 16000000, 500))
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = (os.path.join(tmp, 'data.dat'), os.path.join(tmp, 'data.npy'))
+            d.tofile(paths[0])
+            np.save(paths[1], d)
+            for path in paths:
+                mm = nts.TsdFrame.from_memmap(path, 3, np.int16, self.fs, t0=17)
+                self.assertIsInstance(mm.data(), np.memmap)
+                np.testing.assert_array_equal(mm.restrict(iset).values, reg.restrict(iset).values)
+                np.testing.assert_array_equal(mm.realign(t).values, reg.realign(t).values)
+                np.testing.assert_array_equal(mm.as_units('ms').index.values, reg.as_units('ms').index.values)
+                del mm
+            with self.assertRaises(ValueError):
+                nts.TsdFrame.from_memmap(paths[1], 4, np.int16, self.fs)
+            with self.assertRaises(ValueError):
+                nts.TsdFrame.from_memmap(paths[1], 3, np.float32, self.fs)
+            mm = nts.TsdFrame.from_memmap(paths[1], 3, None, self.fs)
+            self.assertEqual(mm.values.shape, d.shape)
+            del mm
+
+
+class StreamTestCase(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.t = np.cumsum(rng.randint(1, 300, 20000))
+        self.d = np.sin(np.arange(20000) / 50.) + rng.rand(20000) * 0.3
+        self.tsd = nts.Tsd(self.t, self.d)
+
+    @parameterized.expand([
+        (1000,),
+        (37777,),
+        (1.e9,)
+    ])
+    def test_stream_gaps_support(self, chunk_duration):
+        chunks = list(nts.stream(self.tsd, chunk_duration))
+        np.testing.assert_array_equal(np.hstack([c.index.values for c in chunks]), self.t)
+        gaps = nts.GapsAccumulator(250)
+        support = nts.SupportAccumulator(250)
+        for chunk in chunks:
+            gaps.update(chunk)
+            support.update(chunk)
+        np.testing.assert_array_equal(gaps.result().values, self.tsd.gaps(250).values)
+        np.testing.assert_array_equal(support.result().values, self.tsd.support(250).values)
+
+    def test_stream_gaps_small_min_gap(self):
+        tsd = nts.Tsd(np.array([0, 1, 2, 10, 11, 30]), np.zeros(6))
+        gaps = nts.GapsAccumulator(0)
+        support = nts.SupportAccumulator(0)
+        for chunk in nts.stream(tsd, 5):
+            gaps.update(chunk)
+            support.update(chunk)
+        np.testing.assert_array_equal(gaps.result().values, [[3, 9], [12, 29]])
+        np.testing.assert_array_equal(gaps.result().values, tsd.gaps(0).values)
+        np.testing.assert_array_equal(support.result().values, tsd.support(0).values)
+
+    @parameterized.expand([
+        (1000,),
+        (37777,),
+        (1.e9,)
+    ])
+    def test_stream_threshold_restrict(self, chunk_duration):
+        above = nts.ThresholdAccumulator(0.5)
+        for chunk in nts.stream(self.tsd, chunk_duration):
+            above.update(chunk)
+        np.testing.assert_array_equal(self.tsd.restrict(above.result()).index.values, self.t[self.d > 0.5])
+
+        iset = nts.IntervalSet(self.t[::500], self.t[100::500])
+        restricted = [c for c in nts.restrict_stream(nts.stream(self.tsd, chunk_duration), iset, keep_labels=True)]
+        expected = self.tsd.restrict(iset, keep_labels=True)
+        np.testing.assert_array_equal(np.vstack([c.values for c in restricted]), expected.values)
+
+
+class NativeFormatTestCase(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.t = np.cumsum(rng.randint(1, 100, 1000))
+        self.objects = (
+            nts.Ts(self.t),
+            nts.Tsd(self.t, rng.rand(1000)),
+            nts.TsdFrame(self.t, rng.rand(1000, 3).astype(np.float32)),
+            nts.TsdFrame(pd.DataFrame({'a': np.arange(1000), 'b': rng.rand(1000)}, index=self.t)),
+            nts.IntervalSet(self.t[::10], self.t[5::10]),
+            nts.RegularTsdFrame(rng.randint(0, 100, (1000, 2)).astype(np.int16), 1250., t0=17),
+        )
+
+    def test_save_load(self):
+        import tempfile
+        with tempfile.TemporaryDirectory() as tmp:
+            for i, data in enumerate(self.objects):
+                path = os.path.join(tmp, str(i))
+                nts.save(data, path)
+                for mmap_mode in ('r', None):
+                    loaded = nts.load(path, mmap_mode=mmap_mode)
+                    self.assertIs(type(loaded), type(data))
+                    np.testing.assert_array_equal(loaded.index.values, data.index.values)
+                    np.testing.assert_array_equal(np.asarray(loaded.values), np.asarray(data.values))
+                    if hasattr(data, 'columns'):
+                        self.assertEqual(list(loaded.columns), list(data.columns))
+                del loaded
+
+    def test_load_time_units_context(self):
+        import tempfile
+        with tempfile.TemporaryDirectory() as tmp:
+            for i, data in enumerate(self.objects):
+                path = os.path.join(tmp, str(i))
+                nts.save(data, path)
+                with nts.TimeUnits('ms'):
+                    loaded = nts.load(path)
+                np.testing.assert_array_equal(loaded.index.values, data.index.values)
+                del loaded
+
+    def test_load_memmap(self):
+        import tempfile
+        with tempfile.TemporaryDirectory() as tmp:
+            nts.save(self.objects[1], tmp)
+            loaded = nts.load(tmp)
+            self.assertIsInstance(loaded.values, np.memmap)
+            with self.assertRaises(ValueError):
+                loaded.values[0] = 0
+            del loaded
+
+
+class ExtractTestCase(unittest.TestCase):
+    class MetadataStore:
+        """
+        an in-memory store with the metadata interface used by store and extract_from
+        """
+        def __init__(self):
+            self.data = {}
+            self.loads = 0
+            self.writes = 0
+
+        def put(self, key, data, metadata):
+            self.writes += 1
+            self.data[key] = (data, metadata)
+
+        def __setitem__(self, key, data):
+            self.writes += 1
+            self.data[key] = (data, None)
+
+        def keys(self):
+            return ['/' + k for k in self.data]
+
+        def get_with_metadata(self, k):
+            self.loads += 1
+            return self.data[k]
+
+        def get_metadata(self, k):
+            return self.data[k][1]
+
+    def setUp(self):
+        self.store = self.MetadataStore()
+        t = np.arange(0, 1000000, 100)
+        self.objects = {'tsd_' + str(i): nts.Tsd(t, np.random.rand(len(t))) for i in range(10)}
+        self.objects['iset'] = nts.IntervalSet([0, 5000], [1000, 8000])
+        for k, v in self.objects.items():
+            nts.store(v, self.store, k)
+        self.store['other'] = pd.Series([1, 2])
+
+    def test_extract_eager(self):
+        extracted = nts.extract_from(self.store)
+        self.assertEqual(set(extracted), set(self.objects))
+        self.assertEqual(self.store.loads, len(self.store.data))
+
+    def test_store_single_write(self):
+        self.assertEqual(self.store.writes, len(self.objects) + 1)
+
+    def test_store_append_hdf(self):
+        import tempfile
+        try:
+            import tables  # noqa: F401
+        except ImportError:
+            self.skipTest('pytables is not installed')
+        t = np.arange(0, 1000, 10)
+        tsd = nts.Tsd(t, np.random.rand(len(t)))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'session.h5')
+            nts.store_many({'tsd': tsd, 'iset': nts.IntervalSet([0, 50], [10, 60])}, path, format='table')
+            with pd.HDFStore(path) as hdf_store:
+                tsd_next = nts.Tsd(t + 1000, np.random.rand(len(t)))
+                tsd_next.store(hdf_store, 'tsd', append=True)
+                nts.IntervalSet([70], [80]).store(hdf_store, 'iset', append=True)
+                with self.assertRaises(ValueError):
+                    tsd.store(hdf_store, 'tsd', append=True)
+            with pd.HDFStore(path, 'r') as hdf_store:
+                extracted = nts.extract_from(hdf_store)
+        self.assertIsInstance(extracted['tsd'], nts.Tsd)
+        np.testing.assert_array_equal(extracted['tsd'].values, np.hstack((tsd.values, tsd_next.values)))
+        np.testing.assert_array_equal(extracted['iset'].values, [[0, 10], [50, 60], [70, 80]])
+
+    def test_extract_lazy(self):
+        extracted = nts.extract_from(self.store, lazy=True, cache_size=2)
+        self.assertEqual(self.store.loads, 0)
+        self.assertEqual(set(extracted), set(self.objects))
+        self.assertEqual(extracted.nts_class('iset'), 'IntervalSet')
+        self.assertNotIn('other', extracted)
+
+        self.assertIsInstance(extracted['iset'], nts.IntervalSet)
+        np.testing.assert_array_equal(extracted['tsd_3'].values, self.objects['tsd_3'].values)
+        extracted['iset']
+        self.assertEqual(self.store.loads, 2)
+        extracted['tsd_4']
+        extracted['tsd_3']
+        self.assertEqual(self.store.loads, 4)
+        with self.assertRaises(KeyError):
+            extracted['other']
+
+
+class PeriEventTestCase(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.fs = 1000.
+        self.d = rng.rand(10000, 2)
+        self.reg = nts.RegularTsdFrame(self.d, self.fs)
+        self.events = np.array([5000, 100000, 100500, 110000, 9990000])
+        self.window = (-10000, 20000)
+
+    def test_tsd_by_trial_overlapping(self):
+        by_trial = pd.DataFrame(nts.tsd_by_trial(self.reg.as_tsdframe(), pd.Series(self.events), self.window),
+                                copy=False)
+        t = self.reg.index.values
+        for i, e in enumerate(self.events):
+            in_window = (t > e + self.window[0]) & (t <= e + self.window[1])
+            trial = by_trial[by_trial['interval'] == i]
+            np.testing.assert_array_equal(trial.index.values, t[in_window])
+            np.testing.assert_array_equal(trial[[0, 1]].values, self.d[in_window])
+            np.testing.assert_array_equal(trial['latency'].values, t[in_window] - e)
+            self.assertTrue((trial['event_time'] == e).all())
+
+    @parameterized.expand([
+        (True,),
+        (False,)
+    ])
+    def test_peri_event_dense(self, regular_class):
+        data = self.reg if regular_class else self.reg.as_tsdframe()
+        epochs = nts.peri_event(data, self.events, self.window)
+        self.assertEqual(epochs.values.shape, (len(self.events), 30, 2))
+        self.assertIsNone(epochs.offsets)
+        t = self.reg.index.values
+        for i, e in enumerate(self.events):
+            in_window = (t > e + self.window[0]) & (t <= e + self.window[1])
+            defined = ~np.isnan(epochs.values[i, :, 0])
+            np.testing.assert_array_equal(epochs.values[i][defined], self.d[in_window][:defined.sum()])
+            np.testing.assert_array_equal(epochs.latency[i][defined], t[in_window][:defined.sum()] - e)
+        # the first event is 4 samples too close to the start, the last one 11 samples too close to the end
+        np.testing.assert_array_equal(np.isnan(epochs.values[:, :, 0]).sum(axis=1), [4, 0, 0, 0, 11])
+
+    def test_peri_event_fs_grid(self):
+        reg = nts.RegularTsdFrame(np.arange(6002.).reshape(-1, 2), 30000, time_units=nts.time_series.microseconds)
+        events = [50000, 1000000]
+        window = (-10000, 20000)
+        for data in (reg, reg.as_tsdframe()):
+            epochs = nts.peri_event(data, events, window)
+            self.assertEqual(epochs.values.shape, (2, 900, 2))
+            # the second event is after the end of the data
+            self.assertTrue(np.isnan(epochs.values[1]).all())
+            self.assertTrue((epochs.latency > window[0]).all())
+            self.assertTrue((epochs.latency <= window[1]).all())
+
+    def test_peri_event_ragged(self):
+        t = np.sort(np.random.RandomState(1).choice(10000000, 5000, replace=False))
+        tsd = nts.Tsd(t, np.arange(5000.))
+        epochs = nts.peri_event(tsd, self.events, self.window)
+        self.assertEqual(len(epochs.offsets), len(self.events) + 1)
+        for i, e in enumerate(self.events):
+            in_window = (t > e + self.window[0]) & (t <= e + self.window[1])
+            segment = slice(epochs.offsets[i], epochs.offsets[i + 1])
+            np.testing.assert_array_equal(epochs.values[segment, 0], tsd.values[in_window])
+            np.testing.assert_array_equal(epochs.latency[segment], t[in_window] - e)
+
+    def test_peth(self):
+        rng = np.random.RandomState(2)
+        ts_list = [nts.Ts(np.cumsum(rng.randint(1, 2000, n))) for n in (100, 1000, 5000)]
+        events = np.sort(rng.randint(0, 5000, 50))
+        result = nts.peth(ts_list, events, (-20, 50), 5, time_units='ms', max_workers=2)
+        self.assertEqual(result.counts.shape, (3, 50, 14))
+        np.testing.assert_array_equal(result.bins, np.arange(-20000, 50001, 5000))
+        for i, ts in enumerate(ts_list):
+            t = ts.index.values
+            for j, e in enumerate(events):
+                latency = t - e * 1000
+                expected = [((latency > a) & (latency <= b)).sum() for a, b in zip(result.bins[:-1], result.bins[1:])]
+                np.testing.assert_array_equal(result.counts[i, j], expected)
+        np.testing.assert_allclose(result.mean, result.counts.mean(axis=1))
+        np.testing.assert_allclose(result.sem, result.counts.std(axis=1, ddof=1) / np.sqrt(len(events)))
+
+    def test_peth_large_counts(self):
+        # 50000 spikes in a single bin, whose square overflows int32
+        ts = nts.Ts(np.repeat(np.array([1500, 3500], dtype=np.int64), (50000, 10)))
+        result = nts.peth([ts], [0, 2000], (0, 2000), 1000)
+        np.testing.assert_array_equal(result.counts[0], [[0, 50000], [0, 10]])
+        np.testing.assert_allclose(result.sem[0], result.counts[0].std(axis=0, ddof=1) / np.sqrt(2))
+
+
+class CountTestCase(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(3)
+        self.ts_list = [nts.Ts(np.cumsum(rng.randint(1, 3000, n))) for n in (10, 500, 2000)]
+        self.iset = nts.IntervalSet([0, 100000, 400000], [95000, 350000, 400100])
+
+    @parameterized.expand([
+        ('drop',),
+        ('keep',)
+    ])
+    def test_count_func(self, partial):
+        counts = nts.count_func(self.ts_list, 10, self.iset, time_units='ms', partial=partial)
+        self.assertEqual(counts.values.dtype, np.int32)
+        expected_t = []
+        expected = []
+        for start, end in self.iset.values:
+            edges = np.arange(start, end + 1, 10000)
+            if partial == 'keep' and edges[-1] < end:
+                edges = np.append(edges, end)
+            expected_t.extend((edges[:-1] + edges[1:]) // 2)
+            expected.extend([[((ts.index.values > a) & (ts.index.values <= b)).sum() for ts in self.ts_list]
+                             for a, b in zip(edges[:-1], edges[1:])])
+        np.testing.assert_array_equal(counts.index.values, expected_t)
+        np.testing.assert_array_equal(counts.values, np.array(expected).reshape((-1, 3)))
+
+    def test_count_ts(self):
+        ts = self.ts_list[1]
+        counts = ts.count(1000)
+        self.assertIsInstance(counts, nts.Tsd)
+        t = ts.index.values
+        self.assertEqual(counts.index.values[0], t[0] - 1 + 500)
+        # without partial bin, the last spikes may be left out
+        self.assertLessEqual(len(t) - counts.values.sum(), (t[-1] - t[0] + 1) % 1000)
+        np.testing.assert_array_equal(ts.count(1000, partial='keep').values.sum(), len(t))
+        counts = nts.count_func({'a': ts, 'b': self.ts_list[2]}, 1000, self.iset)
+        np.testing.assert_array_equal(counts['a'].values, ts.count(1000, self.iset).values)
+        self.assertEqual(list(counts.columns), ['a', 'b'])
+
+
+class TsGroupTestCase(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(4)
+        self.units = {'u' + str(i): nts.Ts(np.cumsum(rng.randint(1, 5000, n))) for i, n in enumerate((30, 0, 400))}
+        self.group = nts.TsGroup(self.units, metadata={'area': ['CA1', 'CA3', 'CA1']})
+        self.iset = nts.IntervalSet([10000, 200000, 900000], [150000, 600000, 1200000])
+
+    def test_unit_access(self):
+        self.assertEqual(len(self.group), 3)
+        self.assertEqual(self.group.units, ['u0', 'u1', 'u2'])
+        np.testing.assert_array_equal(self.group.offsets, [0, 30, 30, 430])
+        for k, ts in self.units.items():
+            unit = self.group[k]
+            self.assertIsInstance(unit, nts.Ts)
+            np.testing.assert_array_equal(unit.index.values, ts.index.values)
+            if len(unit):
+                self.assertTrue(np.shares_memory(unit.index.values, self.group.t))
+        with nts.TimeUnits('ms'):
+            np.testing.assert_array_equal(self.group['u2'].index.values, self.units['u2'].index.values)
+        sub = self.group[['u2', 'u0']]
+        np.testing.assert_array_equal(sub['u0'].index.values, self.units['u0'].index.values)
+        self.assertEqual(list(sub.metadata['area']), ['CA1', 'CA1'])
+
+    def test_restrict_count_realign(self):
+        restricted = self.group.restrict(self.iset)
+        self.assertEqual(list(restricted.metadata['area']), ['CA1', 'CA3', 'CA1'])
+        for k, ts in self.units.items():
+            np.testing.assert_array_equal(restricted[k].index.values, ts.restrict(self.iset).index.values)
+        counts = self.group.count(10, self.iset, time_units='ms')
+        self.assertEqual(list(counts.columns), self.group.units)
+        np.testing.assert_array_equal(counts.values, nts.count_func(self.units, 10, self.iset, 'ms').values)
+        grid = np.arange(0, 2000000, 1000)
+        realigned = self.group.realign(grid, align='prev')
+        for k, ts in self.units.items():
+            np.testing.assert_array_equal(realigned[k].index.values, ts.index.values // 1000 * 1000)
+
+    def test_store_extract(self):
+        import tempfile
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'group.h5')
+            with pd.HDFStore(path, 'w') as store:
+                self.group.store(store, 'group')
+            with pd.HDFStore(path, 'r') as store:
+                extracted = nts.extract_from(store)['group']
+            nts.save(self.group, os.path.join(tmp, 'group'))
+            loaded = nts.load(os.path.join(tmp, 'group'))
+            for group in (extracted, loaded):
+                self.assertIsInstance(group, nts.TsGroup)
+                np.testing.assert_array_equal(group.t, self.group.t)
+                np.testing.assert_array_equal(group.offsets, self.group.offsets)
+                self.assertEqual(group.units, self.group.units)
+                self.assertEqual(group.unit_metadata, self.group.unit_metadata)
+
+    def test_metadata_frame(self):
+        units = {'a': self.units['u0'], 'b': self.units['u2']}
+        metadata = pd.DataFrame({'area': ['CA3', 'CA1']}, index=['b', 'a'])
+        self.assertEqual(nts.TsGroup(units, metadata=metadata).unit_metadata, {'area': ['CA1', 'CA3']})
+        with self.assertRaisesRegex(ValueError, 'unit keys'):
+            nts.TsGroup(units, metadata=pd.DataFrame({'area': ['CA1', 'CA3']}))
+
+    def test_save_metadata_not_serializable(self):
+        import tempfile
+        group = nts.TsGroup(self.units, metadata={'date': [pd.Timestamp('2020-01-01')] * 3})
+        with tempfile.TemporaryDirectory() as tmp:
+            with self.assertRaisesRegex(ValueError, 'metadata values'):
+                nts.save(group, os.path.join(tmp, 'group'))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -2,6 +2,11 @@ from __future__ import annotations
 
 import pandas as pd
 import numpy as np
+import threading
+import weakref
+from contextvars import ContextVar
+from collections import OrderedDict, namedtuple
+from collections.abc import Mapping
 from warnings import warn
 from typing import Union, Optional
 from pandas.core.internals import SingleBlockManager, BlockManager
@@ -38,7 +43,42 @@ def _get_times(t):
     return t_out
 
 
-class TimeUnits:
+class _ContextState:
+    """
+    A value held in a context variable, so that it is local to each thread and asyncio task, together with the
+    stack of the values to be restored when nested contexts exit.
+    """
+    def __init__(self, name, default):
+        self.value = ContextVar(name, default=default)
+        self.saved = ContextVar(name + '_saved', default=())
+
+    def get(self):
+        return self.value.get()
+
+    def set(self, value):
+        self.value.set(value)
+
+    def push(self, value):
+        self.saved.set(self.saved.get() + (self.value.get(),))
+        self.value.set(value)
+
+    def pop(self):
+        saved = self.saved.get()
+        self.value.set(saved[-1])
+        self.saved.set(saved[:-1])
+
+
+class _TimeUnitsMeta(type):
+    @property
+    def default_time_units(cls):
+        return _default_time_units.get()
+
+    @default_time_units.setter
+    def default_time_units(cls, units):
+        _default_time_units.set(units)
+
+
+class TimeUnits(metaclass=_TimeUnitsMeta):
     """
     This class deals with conversion between different time units for all neuroseries objects.
     It also provides a context manager that tweaks the default time units to the supported units:
@@ -53,8 +93,9 @@ class TimeUnits:
         with nts.TimeUnits('ms'):
             t = self.tsd.times()
 
+    The default time units are local to each thread and asyncio task, and nested contexts restore the enclosing
+    units on exit.
     """
-    default_time_units = None
 
     def __init__(self, units: Union[str, float] = 'us'):
 
@@ -75,11 +116,11 @@ class TimeUnits:
         return self.string
 
     def __enter__(self):
-        TimeUnits.default_time_units = self
+        _default_time_units.push(self)
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        TimeUnits.default_time_units = TimeUnits('us')
+        _default_time_units.pop()
 
     @staticmethod
     def format_timestamps(t, units: Optional['TimeUnits'] = None, give_warning=True):
@@ -100,15 +141,13 @@ class TimeUnits:
 
         t = _get_times(t)
 
-        t = t.astype(np.float64) * units.conversion_factor
+        ts = _to_us(t, units)
+        ts = ts.reshape((len(ts),))
 
-        # noinspection PyUnresolvedReferences,PyTypeChecker
-        ts = t.astype(np.int64).reshape((len(t),))
-
-        if not (np.diff(ts) >= 0).all():
+        if not (ts[1:] >= ts[:-1]).all():
             if give_warning:
                 warn('timestamps are not sorted', UserWarning)
-            ts.sort()
+            ts = np.sort(ts)
         return ts
 
     @staticmethod
@@ -127,14 +166,138 @@ class TimeUnits:
         return t / units.conversion_factor
 
 
-TimeUnits.default_time_units = TimeUnits('us')
+_default_time_units = _ContextState('default_time_units', TimeUnits('us'))
 
 seconds = TimeUnits('s')
 milliseconds = TimeUnits('ms')
 microseconds = TimeUnits('us')
 
 
-class Range:
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'evictions', 'entries', 'nbytes', 'max_bytes'])
+
+
+def _nbytes(data):
+    """
+    the memory footprint of a neuroseries object (values and index), in bytes
+    """
+    if isinstance(data, pd.DataFrame):
+        # a plain DataFrame view, as the summary Series cannot be built with the Tsd constructor
+        return int(pd.DataFrame(data, copy=False).memory_usage(index=True).sum())
+    if isinstance(data, pd.Series):
+        return int(data.memory_usage(index=True))
+    if isinstance(data, TsGroup):
+        return int(data.t.nbytes + data.offsets.nbytes)
+    return int(np.asarray(data).nbytes)
+
+
+class _RestrictCache:
+    """
+    The results of the .r properties, keyed by (object, interval).
+
+    Objects and intervals are held through weak references, so that the cache does not keep them alive: the
+    entries of an object (or interval) are dropped when it is garbage collected, and a lookup checks that the
+    entry was made for the same objects, as their ids can be reused. The entries are evicted in least recently used order when
+    their total size exceeds max_bytes, and the entries for an interval are dropped when the Range context
+    defining it exits.
+    """
+    def __init__(self, max_bytes=2 ** 30):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.RLock()
+
+    def _lookup(self, data, interval):
+        key = (id(data), id(interval))
+        entry = self.entries.get(key)
+        if entry is None:
+            return key, None
+        if entry[0]() is not data or entry[1]() is not interval:
+            # an entry left by objects that had the same ids
+            self.discard(key)
+            return key, None
+        return key, entry
+
+    def peek(self, data, interval):
+        with self.lock:
+            entry = self._lookup(data, interval)[1]
+        return None if entry is None else entry[2]
+
+    def get(self, data, interval, compute):
+        """
+        returns the cached result for (data, interval), calling compute(data, interval) to fill the cache on a
+        miss
+        """
+        with self.lock:
+            key, entry = self._lookup(data, interval)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+        result = compute(data, interval)
+        nbytes = _nbytes(result)
+        if nbytes <= self.max_bytes:
+            discard = self.discard
+            data_ref = weakref.ref(data, lambda _, k=key: discard(k))
+            interval_ref = weakref.ref(interval, lambda _, k=key: discard(k))
+            with self.lock:
+                self.discard(key)
+                self.entries[key] = (data_ref, interval_ref, result, nbytes)
+                self.nbytes += nbytes
+                self.shrink(self.max_bytes)
+        return result
+
+    def discard(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.nbytes -= entry[3]
+
+    def discard_object(self, data):
+        with self.lock:
+            for key in [k for k in self.entries if k[0] == id(data)]:
+                self.discard(key)
+
+    def discard_interval(self, interval):
+        with self.lock:
+            for key in [k for k in self.entries if k[1] == id(interval)]:
+                self.discard(key)
+
+    def shrink(self, max_bytes):
+        with self.lock:
+            while self.nbytes > max_bytes:
+                key = next(iter(self.entries))
+                self.discard(key)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.nbytes = 0
+
+    def info(self):
+        with self.lock:
+            return CacheInfo(self.hits, self.misses, self.evictions, len(self.entries), self.nbytes,
+                             self.max_bytes)
+
+
+class _RangeMeta(type):
+    @property
+    def interval(cls):
+        return _range_interval.get()
+
+    @interval.setter
+    def interval(cls, interval):
+        _range_interval.set(_as_interval_set(interval))
+
+
+_range_interval = _ContextState('range_interval', None)
+
+
+class Range(metaclass=_RangeMeta):
     """
     A class defining a window to restrict analyses.
 
@@ -145,9 +308,13 @@ class Range:
 
         with nts.Range(range_interval):
             np.testing.assert_array_almost_equal_nulp(self.tsd.r.times(), tsd_r.times())
+
+    Range contexts can be nested: the innermost window is used, and the enclosing one is restored on exit. The
+    window is local to each thread and asyncio task.
+    The restricted objects are kept in a cache (see :py:meth:`cache_info`), that holds weak references to the
+    original objects and is bounded to a memory budget (see :py:meth:`set_cache_budget`).
     """
-    interval = None
-    cached_objects = []
+    cache = _RestrictCache()
 
     def __init__(self, a, b=None, time_units: Optional[str] = None):
         """
@@ -162,18 +329,139 @@ class Range:
             start = TimeUnits.format_timestamps(np.array((a,), dtype=np.int64).ravel(), time_units)
             end = TimeUnits.format_timestamps(np.array((b,), dtype=np.int64).ravel(), time_units)
             from neuroseries.interval_set import IntervalSet
-            Range.interval = IntervalSet(start, end)
+            self.window = IntervalSet(start, end)
         else:
-            Range.interval = a
+            self.window = _as_interval_set(a)
 
     def __enter__(self):
-        return Range.interval
+        _range_interval.push(self.window)
+        return self.window
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        Range.interval = None
-        for i in Range.cached_objects:
-            i.invalidate_restrict_cache()
-        self.cached_objects = []
+        _range_interval.pop()
+        if self.window is not Range.interval:
+            Range.cache.discard_interval(self.window)
+
+    @staticmethod
+    def restricted(data, compute):
+        """
+        The version of data restricted to the current window, computed as compute(data, window) and cached.
+        """
+        if Range.interval is None:
+            raise ValueError('no window interval set')
+        return Range.cache.get(data, Range.interval, compute)
+
+    @staticmethod
+    def cache_info():
+        """
+        Statistics of the restriction cache
+
+        Returns:
+            a CacheInfo named tuple (hits, misses, evictions, entries, nbytes, max_bytes)
+        """
+        return Range.cache.info()
+
+    @staticmethod
+    def set_cache_budget(max_bytes):
+        """
+        Sets the maximum total size of the restricted objects kept in the cache, evicting the least recently used
+        ones if needed.
+
+        Args:
+            max_bytes: the budget in bytes
+        """
+        Range.cache.max_bytes = max_bytes
+        Range.cache.shrink(max_bytes)
+
+    @staticmethod
+    def cache_clear():
+        Range.cache.clear()
+
+
+def _slices_index(lo, hi):
+    """
+    the positions selected by a group of sorted, non-overlapping slices [lo[i], hi[i]).
+
+    Returns:
+        a slice object if at most one of the slices is not empty (so that the selection is a view), or an
+        index array for a single gather otherwise
+    """
+    counts = hi - lo
+    nz = np.flatnonzero(counts > 0)
+    if len(nz) == 0:
+        return slice(0, 0)
+    if len(nz) == 1:
+        return slice(lo[nz[0]], hi[nz[0]])
+    lo = lo[nz]
+    counts = counts[nz]
+    offsets = np.cumsum(counts) - counts
+    ix = np.arange(offsets[-1] + counts[-1], dtype=np.int64)
+    ix += np.repeat(lo - offsets, counts)
+    return ix
+
+
+def _slices_labels(lo, hi):
+    """
+    the index of the slice each position selected by :func:`_slices_index` belongs to
+    """
+    return np.repeat(np.arange(len(lo), dtype=np.int64), hi - lo)
+
+
+def _as_interval_set(iset):
+    """
+    the IntervalSet an operation works on, materializing a :class:`~neuroseries.interval_set.LazyIntervalSet`
+    """
+    return iset.compute() if hasattr(iset, 'compute') else iset
+
+
+def _as_time_units(units):
+    if units is None:
+        return TimeUnits.default_time_units
+    if isinstance(units, str):
+        return TimeUnits(units)
+    return units
+
+
+def _to_us(t, units=None):
+    """
+    converts times (or durations) to int64 us, keeping their order. Integer times in us, ms or s are converted
+    exactly. The result is always a new array, so that the caller's array is never shared with the index of the
+    time series built from it.
+    :param t: an array, list or pandas Series of times
+    :param units: the time units of t (default: the default time units)
+    """
+    t = np.asarray(t.values if isinstance(t, pd.Series) else t)
+    factor = _as_time_units(units).conversion_factor
+    if t.dtype.kind in 'iu' and float(factor).is_integer():
+        ts = t.astype(np.int64)
+        if factor != 1:
+            ts *= np.int64(factor)
+        return ts
+    return (t.astype(np.float64) * factor).astype(np.int64)
+
+
+def _cached_times(data, units):
+    """
+    the times of a Tsd/TsdFrame in the desired units, memoized on the object as long as its index is not replaced
+    """
+    units = _as_time_units(units)
+    cache = getattr(data, 'times_cache', None)
+    if cache is None or cache[0] is not data.index:
+        cache = (data.index, {})
+        data.times_cache = cache
+    t = cache[1].get(units.conversion_factor)
+    if t is None:
+        t = TimeUnits.return_timestamps(data.index.values.astype(np.float64), units)
+        t.flags.writeable = False
+        cache[1][units.conversion_factor] = t
+    return t
+
+
+def _first_last_time(data, i, units):
+    """
+    the time of the first (i = 0) or last (i = -1) data point, converting only that one
+    """
+    return TimeUnits.return_timestamps(np.float64(data.index.values[i]), _as_time_units(units))
 
 
 def _get_restrict_method(align):
@@ -212,9 +500,10 @@ class Tsd(pd.Series):
             t = TimeUnits.format_timestamps(t, time_units)
             super().__init__(index=t, data=d, **kwargs)
         self.index.name = "Time (us)"
-        self._metadata.append("nts_class")
+        if "nts_class" not in self._metadata:
+            self._metadata.append("nts_class")
         self.nts_class = self.__class__.__name__
-        self.r_cache = None
+        self.times_cache = None
 
     def times(self, units=None):
         """
@@ -224,10 +513,12 @@ class Tsd(pd.Series):
             units: the desired time units
 
         Returns:
-            ts: the times vector
+            ts: the times vector. It is cached until the index is replaced and shared between calls, so it is
+            read-only: in-place operations such as ``t -= t[0]`` raise ValueError, use ``t = t - t[0]`` or
+            ``times().copy()`` instead.
 
         """
-        return TimeUnits.return_timestamps(self.index.values.astype(np.float64), units)
+        return _cached_times(self, units)
 
     def as_series(self):
         """
@@ -266,26 +557,29 @@ class Tsd(pd.Series):
         """
         return self.values
 
-    def realign(self, t, align='closest'):
+    def realign(self, t, align='closest', tolerance=None, time_units=None, return_indices=False):
         """
         Provides a new Series only including the data points that are close to one time point in the t argument.
 
+        The matching is done with binary searches on the sorted time index, duplicate timestamps are allowed.
+
         Args:
             t: the aligning series, in numpy or pandas format
             align: the values accepted by :func:`pandas.Series.reindex` plus
             - next (similar to bfill)
             - prev (similar to ffill)
             - closest (similar to nearest)
+            tolerance: if not None, the maximum distance between a time in t and the matched data point. Times in
+            t with no match within tolerance get NaN.
+            time_units: the time units of tolerance, and of t if it is not a pandas object
+            return_indices: if True, also returns the positions of the matched data points (-1 for no match)
+            and their time offsets t - matched time (in us, 0 for no match)
 
         Returns:
-            The realigned Tsd
+            The realigned Tsd, or a tuple (realigned, indices, offsets) if return_indices is True
 
         """
-        method = _get_restrict_method(align)
-        ix = TimeUnits.format_timestamps(t.index.values)
-
-        rest_t = self.reindex(ix, method=method)
-        return rest_t
+        return realign_func(self, t, align, tolerance, time_units, return_indices)
 
     def restrict(self, iset, keep_labels=False):
         """
@@ -297,21 +591,33 @@ class Tsd(pd.Series):
             each point falls.
 
         Returns:
-            the restricted Tsd. If keep_labels is True, it will be a TsdFrame
+            the restricted Tsd. If keep_labels is True, it will be a TsdFrame. If only one interval contains data
+            points, the data of the result are a view on the data of self.
         """
-        ix = iset.in_interval(self)
-        tsd_r = pd.DataFrame(self, copy=True)
-        col = tsd_r.columns[0]
-        tsd_r['interval'] = ix.astype(np.int64)
-        # noinspection PyUnresolvedReferences
-        ix = ~np.isnan(ix)
-        tsd_r = tsd_r[ix]
+        lo, hi = _as_interval_set(iset).slice_bounds(self)
+        return self._restrict_slices(lo, hi, keep_labels)
 
+    def _restrict_slices(self, lo, hi, keep_labels):
+        sel = _slices_index(lo, hi)
         if not keep_labels:
-            s = tsd_r.iloc[:, col]
-            return Tsd(s)
-        del tsd_r[0]
-        return TsdFrame(tsd_r, copy=True)
+            return Tsd(pd.Series(self.values[sel], index=self.index[sel], copy=False))
+        tsd_r = pd.DataFrame({'interval': _slices_labels(lo, hi)}, index=self.index[sel])
+        return TsdFrame(tsd_r)
+
+    def split(self, iset, as_arrays=False):
+        """
+        Iterates over the intervals of a :func:`~neuroseries.interval_set.IntervalSet`, yielding the part of the
+        data falling in each interval as a zero-copy view.
+
+        Args:
+            iset: the interval set
+            as_arrays: if True, the segments are yielded as a tuple (times, data) of numpy views, which is lighter
+            than a neuroseries object
+
+        Returns:
+            a generator of tuples (start, end, segment), one per interval, with start and end in us
+        """
+        return split_func(self, iset, as_arrays)
 
     def gaps(self, min_gap, method='absolute'):
         """
@@ -342,7 +648,7 @@ class Tsd(pd.Series):
         Returns:
             A time
         """
-        return self.times(units=units)[0]
+        return _first_last_time(self, 0, units)
 
     def end_time(self, units=microseconds):
         """
@@ -353,25 +659,21 @@ class Tsd(pd.Series):
         Returns:
             A time
         """
-        return self.times(units=units)[-1]
+        return _first_last_time(self, -1, units)
 
-    def store(self, the_store, key, **kwargs):
+    def store(self, the_store, key, append=False, **kwargs):
         """
         Saves the data in the HDF5 file keeping
         Args:
             the_store:
             key:
+            append: if True, appends to the data already stored under key, see :func:`store`
             **kwargs:
 
         Returns:
 
         """
-        data_to_store = self.as_series()
-
-        the_store[key] = data_to_store
-        # noinspection PyProtectedMember
-        metadata = {k: getattr(self, k) for k in self._metadata}
-        the_store.put(key, data_to_store, metadata, **kwargs)
+        store(self, the_store, key, append=append, **kwargs)
 
     @property
     def r(self):
@@ -380,16 +682,14 @@ class Tsd(pd.Series):
         Returns:
             the restricted Tsd
         """
-        if Range.interval is None:
-            raise ValueError('no window interval set')
-        if self.r_cache is None:
-            self.r_cache = self.restrict(Range.interval)
-            Range.cached_objects.append(self)
+        return Range.restricted(self, lambda data, interval: data.restrict(interval))
 
-        return self.r_cache
+    @property
+    def r_cache(self):
+        return Range.cache.peek(self, Range.interval)
 
     def invalidate_restrict_cache(self):
-        self.r_cache = None
+        Range.cache.discard_object(self)
 
     @property
     def _constructor(self):
@@ -405,9 +705,42 @@ class TsdFrame(pd.DataFrame):
             t = TimeUnits.format_timestamps(t, time_units)
             super().__init__(index=t, data=d, **kwargs)
         self.index.name = "Time (us)"
-        self._metadata.append("nts_class")
+        if "nts_class" not in self._metadata:
+            self._metadata.append("nts_class")
         self.nts_class = self.__class__.__name__
-        self.r_cache = None
+        self.times_cache = None
+
+    @staticmethod
+    def from_memmap(path, n_channels, dtype, fs, t0=0, time_units=None, columns=None, offset=0):
+        """
+        A regularly sampled frame backed by a raw binary recording, memory-mapped read-only so that nothing is
+        read when it is created: restrict, realign and data() read only the samples they return.
+
+        Args:
+            path: the file, either raw data with interleaved channels (such as a .dat file) or a .npy file
+            n_channels: the number of channels
+            dtype: the data type of the samples. For a .npy file it must match the stored type, or be None
+            fs: the sampling rate, in Hz
+            t0: the time of the first sample
+            time_units: the time units in which t0 is specified
+            columns: the channel names (default: 0, 1, ...)
+            offset: the size of the header of a raw file, in bytes
+
+        Returns:
+            a RegularTsdFrame over the memory-mapped data
+        """
+        if str(path).endswith('.npy'):
+            d = np.load(path, mmap_mode='r')
+            if dtype is not None and d.dtype != np.dtype(dtype):
+                raise ValueError('the file holds ' + str(d.dtype) + ' data, not ' + str(np.dtype(dtype)))
+            if d.ndim > 2 or (d.ndim == 2 and d.shape[1] != n_channels):
+                raise ValueError('the file holds ' + str(d.shape) + ' data, not ' + str(n_channels) + ' channels')
+        else:
+            d = np.memmap(path, dtype=dtype, mode='r', offset=offset)
+        if d.ndim == 1 and len(d) % n_channels:
+            raise ValueError('the file size is not a multiple of n_channels samples')
+        d = d.reshape((-1, n_channels))
+        return RegularTsdFrame(d, fs, t0=t0, columns=columns, time_units=time_units)
 
     def times(self, units=None):
         """
@@ -417,10 +750,12 @@ class TsdFrame(pd.DataFrame):
             units: the desired time units
 
         Returns:
-            ts: the times vector
+            ts: the times vector. It is cached until the index is replaced and shared between calls, so it is
+            read-only: in-place operations such as ``t -= t[0]`` raise ValueError, use ``t = t - t[0]`` or
+            ``times().copy()`` instead.
 
         """
-        return TimeUnits.return_timestamps(self.index.values.astype(np.float64), units)
+        return _cached_times(self, units)
 
     def as_dataframe(self, copy=True):
         """
@@ -473,26 +808,29 @@ class TsdFrame(pd.DataFrame):
             return self.values.ravel()
         return self.values
 
-    def realign(self, t, align='closest'):
+    def realign(self, t, align='closest', tolerance=None, time_units=None, return_indices=False):
         """
         Provides a new Series only including the data points that are close to one time point in the t argument.
 
+        The matching is done with binary searches on the sorted time index, duplicate timestamps are allowed.
+
         Args:
             t: the aligning series, in numpy or pandas format
             align: the values accepted by :func:`pandas.Series.reindex` plus
             - next (similar to bfill)
             - prev (similar to ffill)
             - closest (similar to nearest)
+            tolerance: if not None, the maximum distance between a time in t and the matched data point. Times in
+            t with no match within tolerance get NaN.
+            time_units: the time units of tolerance, and of t if it is not a pandas object
+            return_indices: if True, also returns the positions of the matched data points (-1 for no match)
+            and their time offsets t - matched time (in us, 0 for no match)
 
         Returns:
-            The realigned TsdFrame
+            The realigned TsdFrame, or a tuple (realigned, indices, offsets) if return_indices is True
 
         """
-        method = _get_restrict_method(align)
-        ix = TimeUnits.format_timestamps(t)
-
-        rest_t = self.reindex(ix, method=method, columns=self.columns.values)
-        return rest_t
+        return realign_func(self, t, align, tolerance, time_units, return_indices)
 
     def restrict(self, iset, keep_labels=False):
         """
@@ -504,45 +842,59 @@ class TsdFrame(pd.DataFrame):
             each point falls.
 
         Returns:
-            the restricted Tsd. If keep_labels is True, it will be a TsdFrame
-        """
-        ix = iset.in_interval(self)
-        tsd_r = pd.DataFrame(self, copy=True)
-        tsd_r['interval'] = ix.astype(np.int64)
-        # noinspection PyUnresolvedReferences
-        ix = ~np.isnan(ix)
-        tsd_r = tsd_r[ix]
-        if not keep_labels:
-            del tsd_r['interval']
-        return TsdFrame(tsd_r, copy=True)
+            the restricted Tsd. If keep_labels is True, it will be a TsdFrame. If only one interval contains data
+            points, the data of the result are a view on the data of self.
+        """
+        lo, hi = _as_interval_set(iset).slice_bounds(self)
+        return self._restrict_slices(lo, hi, keep_labels)
 
-    def gaps(self, min_gap, method='absolute'):
+    def _restrict_slices(self, lo, hi, keep_labels):
+        tsd_r = self.iloc[_slices_index(lo, hi)]
+        if keep_labels:
+            tsd_r = tsd_r.assign(interval=_slices_labels(lo, hi))
+        return TsdFrame(tsd_r)
+
+    def split(self, iset, as_arrays=False):
+        """
+        Iterates over the intervals of a :func:`~neuroseries.interval_set.IntervalSet`, yielding the part of the
+        data falling in each interval as a zero-copy view.
+
+        Args:
+            iset: the interval set
+            as_arrays: if True, the segments are yielded as a tuple (times, data) of numpy views, which is lighter
+            than a neuroseries object
+
+        Returns:
+            a generator of tuples (start, end, segment), one per interval, with start and end in us
+        """
+        return split_func(self, iset, as_arrays)
+
+    def gaps(self, min_gap, method='absolute', per_column=False):
         """
         finds gaps in a tsd
         :param self: a Tsd/TsdFrame
         :param min_gap: the minimum gap that will be considered
         :param method: 'absolute': min gap is expressed in time (us), 'median',
         min_gap expressed in units of the median inter-sample event
-        :return: an IntervalSet containing the gaps in the TSd
+        :param per_column: if True, finds the gaps of each column, its NaN values being treated as missing samples
+        :return: an IntervalSet containing the gaps in the TSd, or a dict of IntervalSet's by column if per_column
         """
-        return gaps_func(self, min_gap, method)
+        return gaps_func(self, min_gap, method, per_column)
 
-    def support(self, min_gap, method='absolute'):
+    def support(self, min_gap, method='absolute', per_column=False):
         """
         find the smallest (to a min_gap resolution) IntervalSet containing all the times in the Tsd
         :param min_gap: the minimum gap that will be considered
         :param method: 'absolute': min gap is expressed in time (us), 'median',
         min_gap expressed in units of the median inter-sample event
-        :return: an IntervalSet
+        :param per_column: if True, finds the support of each column, its NaN values being treated as missing
+        samples
+        :return: an IntervalSet, or a dict of IntervalSet's by column if per_column
         """
-        return support_func(self, min_gap, method)
+        return support_func(self, min_gap, method, per_column)
 
-    def store(self, the_store, key, **kwargs):
-        data_to_store = pd.DataFrame(self)
-        the_store[key] = data_to_store
-        # noinspection PyProtectedMember
-        metadata = {k: getattr(self, k) for k in self._metadata}
-        the_store.put(key, data_to_store, metadata, **kwargs)
+    def store(self, the_store, key, append=False, **kwargs):
+        store(self, the_store, key, append=append, **kwargs)
 
     def start_time(self, units='us'):
         """
@@ -553,7 +905,7 @@ class TsdFrame(pd.DataFrame):
         Returns:
             A time
         """
-        return self.times(units=units)[0]
+        return _first_last_time(self, 0, units)
 
     def end_time(self, units='us'):
         """
@@ -564,7 +916,7 @@ class TsdFrame(pd.DataFrame):
         Returns:
             A time
         """
-        return self.times(units=units)[-1]
+        return _first_last_time(self, -1, units)
 
     @property
     def _constructor(self):
@@ -581,16 +933,14 @@ class TsdFrame(pd.DataFrame):
         Returns:
             the restricted TsdFrame
         """
-        if Range.interval is None:
-            raise ValueError('no window interval set')
-        if self.r_cache is None:
-            self.r_cache = self.restrict(Range.interval)
-            Range.cached_objects.append(self)
+        return Range.restricted(self, lambda data, interval: data.restrict(interval))
 
-        return self.r_cache
+    @property
+    def r_cache(self):
+        return Range.cache.peek(self, Range.interval)
 
     def invalidate_restrict_cache(self):
-        self.r_cache = None
+        Range.cache.discard_object(self)
 
 
 # noinspection PyAbstractClass
@@ -599,50 +949,870 @@ class Ts(Tsd):
         super().__init__(t, None, time_units=time_units, **kwargs)
         self.nts_class = self.__class__.__name__
 
+    def count(self, bin_size, iset=None, time_units=None, partial='drop'):
+        """
+        counts the events in regular bins, aligned on the start of each interval of iset
+        (see :func:`count_func`)
+        :param bin_size: the bin duration
+        :param iset: the IntervalSet in which the events are counted (default: the span of the events)
+        :param time_units: the time units of bin_size
+        :param partial: 'drop' or 'keep' the last, shorter bin of each interval
+        :return: a Tsd of int32 counts, indexed by the bin centers
+        """
+        counts = count_func([self], bin_size, iset=iset, time_units=time_units, partial=partial)
+        return Tsd(pd.Series(counts.values[:, 0], index=counts.index, copy=False))
 
-def gaps_func(data, min_gap, method='absolute'):
+
+def _ts_from_times(t):
     """
-    finds gaps in a tsd
-    :param data: a Tsd/TsdFrame
-    :param min_gap: the minimum gap that will be considered
-    :param method: 'absolute': min gap is expressed in time (us), 'median',
-    min_gap expressed in units of the median inter-sample event
-    :return: an IntervalSet containing the gaps in the TSd
+    a Ts wrapping int64 times (us) without conversion or copy, for internal callers that own the array (memory
+    maps, the times of a TsGroup)
+    """
+    return Ts(pd.Series(index=pd.Index(t, copy=False), dtype=np.float64))
+
+
+class _RegularTimes:
+    """
+    The times of a regularly sampled series, computed arithmetically: sample k is at t0 + int(k * 1e6 / fs) us,
+    as :func:`TimeUnits.format_timestamps` would give for sample numbers in fps units.
+
+    It supports the array operations needed to search the times (len, indexing and searchsorted) without
+    materializing them.
+    """
+    def __init__(self, t0, fs, n):
+        self.t0 = np.int64(t0)
+        self.fs = float(fs)
+        self.dt = 1e6 / self.fs
+        self.n = n
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            k = np.arange(*k.indices(self.n))
+        else:
+            k = np.asarray(k)
+            k = np.where(k < 0, k + self.n, k)
+        return self.t0 + (k.astype(np.float64) * self.dt).astype(np.int64)
+
+    def searchsorted(self, t, side='left'):
+        """
+        as :func:`numpy.searchsorted` on the times, with the positions estimated arithmetically and corrected for
+        the rounding of the times
+        """
+        t = np.asarray(t)
+        shape = t.shape
+        t = t.ravel()
+        k = np.ceil((t - self.t0) / self.dt)
+        k = np.clip(k, 0, self.n).astype(np.int64)
+        before = np.less if side == 'left' else np.less_equal
+        while True:
+            up = k < self.n
+            up[up] = before(self[k[up]], t[up])
+            down = k > 0
+            down[down] = ~before(self[k[down] - 1], t[down])
+            if not (up.any() or down.any()):
+                return k.reshape(shape)
+            k += up
+            k -= down
+
+
+class RegularTsdFrame:
     """
-    dt = np.diff(data.times(units=TimeUnits.default_time_units))
+    A regularly sampled multi-channel time series, whose time axis is stored as (t0, fs, n) and materialized only
+    on demand.
 
+    It is stored (see :func:`store`) as the DataFrame of its samples, without time index, with fs and t0 in the
+    metadata.
+
+    Sample k is at time t0 + int(k * 1e6 / fs) us, the same times as a TsdFrame built from sample numbers with
+    :class:`TimeUnits` in fps units, so that the two can be used interchangeably with IntervalSet's. Restrict and
+    realign compute sample positions arithmetically and return TsdFrame's containing only the selected samples.
+    """
+    # the attributes saved with the stored data, see :func:`store`
+    _metadata = ['nts_class', 'fs', 't0']
+
+    def __init__(self, d, fs, t0=0, columns=None, time_units=None):
+        """
+        RegularTsdFrame initializer.
+
+        Args:
+            d: the data, an array with one row per sample and one column per channel
+            fs: the sampling rate, in Hz
+            t0: the time of the first sample
+            columns: the column names (default: 0, 1, ...)
+            time_units: the time units in which t0 is specified
+        """
+        d = np.asanyarray(d)
+        if d.ndim == 1:
+            d = d.reshape((-1, 1))
+        self.d = d
+        self.fs = float(fs)
+        self.t0 = TimeUnits.format_timestamps(np.array((t0,)), time_units)[0]
+        self.columns = pd.Index(columns if columns is not None else np.arange(d.shape[1]))
+        self.time_axis = _RegularTimes(self.t0, self.fs, d.shape[0])
+        self.nts_class = self.__class__.__name__
+
+    def __len__(self):
+        return self.d.shape[0]
+
+    @property
+    def values(self):
+        """
+        The data as a numpy array (n samples x n columns)
+        """
+        return self.d
+
+    @property
+    def index(self):
+        """
+        The time index, materialized at each call
+        """
+        return pd.Index(self.time_axis[:], name="Time (us)")
+
+    def data(self):
+        """
+        The values of the Frame
+        Returns:
+            the data as numpy array
+        """
+        if len(self.columns) == 1:
+            return self.d.ravel()
+        return self.d
+
+    def times(self, units=None):
+        """
+        The times of the RegularTsdFrame, returned as np.double in the desired time units, computed arithmetically
+
+        Args:
+            units: the desired time units
+
+        Returns:
+            ts: the times vector
+        """
+        return TimeUnits.return_timestamps(self.time_axis[:].astype(np.float64), _as_time_units(units))
+
+    def start_time(self, units='us'):
+        return TimeUnits.return_timestamps(np.float64(self.time_axis[0]), _as_time_units(units))
+
+    def end_time(self, units='us'):
+        return TimeUnits.return_timestamps(np.float64(self.time_axis[-1]), _as_time_units(units))
+
+    def searchsorted(self, t, side='left'):
+        """
+        The positions at which the times t would be inserted in the time axis, as :func:`numpy.searchsorted`,
+        computed arithmetically
+        """
+        return self.time_axis.searchsorted(t, side=side)
+
+    def as_tsdframe(self):
+        """
+        Returns:
+            the data as a TsdFrame with an explicit time index (the data are not copied)
+        """
+        return TsdFrame(pd.DataFrame(self.d, index=self.time_axis[:], columns=self.columns, copy=False))
+
+    def as_units(self, units=None):
+        """
+        returns a DataFrame with time expressed in the desired unit
+        :param units: us (s), ms, or s
+        :return: DataFrame with adjusted times
+        """
+        df = pd.DataFrame(index=self.times(units), data=self.d, columns=self.columns.copy())
+        units_str = str(units)
+        if not units_str:
+            units_str = 'us'
+        df.index.name = "Time (" + units_str + ")"
+        return df
+
+    def restrict(self, iset, keep_labels=False):
+        """
+        Restricts the RegularTsdFrame to a set of times delimited by a :func:`~neuroseries.interval_set.IntervalSet`
+
+        The sample positions of the interval bounds are computed arithmetically, and only the selected samples are
+        read.
+
+        Args:
+            iset: the restricting interval set
+            keep_labels: if True, a column is added with the index of the interval in the interval_set in which
+            each point falls.
+
+        Returns:
+            the restricted TsdFrame
+        """
+        lo, hi = _as_interval_set(iset).slice_bounds(self)
+        return self._restrict_slices(lo, hi, keep_labels)
+
+    def _restrict_slices(self, lo, hi, keep_labels):
+        sel = _slices_index(lo, hi)
+        tsd_r = pd.DataFrame(self.d[sel], index=self.time_axis[sel], columns=self.columns, copy=False)
+        if keep_labels:
+            tsd_r['interval'] = _slices_labels(lo, hi)
+        return TsdFrame(tsd_r)
+
+    def split(self, iset, as_arrays=False):
+        """
+        Iterates over the intervals of a :func:`~neuroseries.interval_set.IntervalSet`, yielding the samples in
+        each interval, see :func:`TsdFrame.split`.
+
+        Args:
+            iset: the interval set
+            as_arrays: if True, the segments are yielded as a tuple (times, data), the data being a view
+
+        Returns:
+            a generator of tuples (start, end, segment), one per interval, with start and end in us, the segments
+            being TsdFrame's over views of the data
+        """
+        return split_func(self, iset, as_arrays)
+
+    def realign(self, t, align='closest', tolerance=None, time_units=None, return_indices=False):
+        """
+        Provides a TsdFrame with the samples closest to the time points in the t argument, see
+        :func:`TsdFrame.realign`. The matching samples are found arithmetically.
+        """
+        return realign_func(self, t, align, tolerance, time_units, return_indices)
+
+    def gaps(self, min_gap, method='absolute', per_column=False):
+        """
+        finds gaps in the RegularTsdFrame. There are none unless min_gap is smaller than the sampling interval.
+        :param min_gap: the minimum gap that will be considered
+        :param method: 'absolute': min gap is expressed in time (us), 'median',
+        min_gap expressed in units of the median inter-sample event
+        :param per_column: if True, finds the gaps of each column, its NaN values being treated as missing samples
+        :return: an IntervalSet containing the gaps, or a dict of IntervalSet's by column if per_column
+        """
+        if not per_column and _regular_without_gaps(self, min_gap, method):
+            from neuroseries.interval_set import IntervalSet
+            return IntervalSet.from_sorted_arrays(np.empty((0, 2), dtype=np.int64))
+        return gaps_func(self, min_gap, method, per_column)
+
+    def support(self, min_gap, method='absolute', per_column=False):
+        """
+        find the smallest (to a min_gap resolution) IntervalSet containing all the times in the RegularTsdFrame
+        :param min_gap: the minimum gap that will be considered
+        :param method: 'absolute': min gap is expressed in time (us), 'median',
+        min_gap expressed in units of the median inter-sample event
+        :param per_column: if True, finds the support of each column, its NaN values being treated as missing
+        samples
+        :return: an IntervalSet, or a dict of IntervalSet's by column if per_column
+        """
+        if not per_column and _regular_without_gaps(self, min_gap, method):
+            from neuroseries.interval_set import IntervalSet
+            return IntervalSet.from_sorted_arrays(np.array([[self.time_axis[0] - 1, self.time_axis[-1] + 1]]))
+        return support_func(self, min_gap, method, per_column)
+
+    def store(self, the_store, key, **kwargs):
+        store(self, the_store, key, **kwargs)
+
+    @classmethod
+    def from_stored(cls, df, metadata):
+        """
+        makes a RegularTsdFrame from the DataFrame and metadata written by :func:`store`
+        """
+        return cls(df.values, metadata['fs'], t0=metadata['t0'], columns=df.columns, time_units=microseconds)
+
+    @property
+    def r(self):
+        """
+        if in a Range context, returns the RegularTsdFrame restricted to that Range
+        Returns:
+            the restricted TsdFrame
+        """
+        return Range.restricted(self, lambda data, interval: data.restrict(interval))
+
+    @property
+    def r_cache(self):
+        return Range.cache.peek(self, Range.interval)
+
+    def invalidate_restrict_cache(self):
+        Range.cache.discard_object(self)
+
+
+class TsGroup:
+    """
+    A group of spike trains (or other event series), stored in a compressed sparse row layout: the times of all
+    the units in a single int64 array, the times of unit i being t[offsets[i]:offsets[i + 1]]. Per-unit metadata
+    are kept in a DataFrame indexed by the unit keys.
+
+    Restrict, count and realign work on the whole group at once, and the units are accessed by key as Ts's
+    whose times are views on the group array.
+    """
+    # the attributes saved with the stored data, see :func:`store`
+    _metadata = ['nts_class', 'units', 'unit_metadata']
+
+    def __init__(self, data, metadata=None, time_units=None):
+        """
+        TsGroup initializer.
+
+        Args:
+            data: a dict of Ts/Tsd's (or of arrays of sorted times) keyed by unit, or a list of them (the keys
+            being then 0, 1, ...)
+            metadata: the per-unit metadata, a dict of columns in the order of the units, or a DataFrame indexed
+            by the unit keys
+            time_units: the time units of the times given as arrays
+        """
+        if isinstance(data, Mapping):
+            keys = list(data.keys())
+            data = list(data.values())
+        else:
+            data = list(data)
+            keys = list(range(len(data)))
+        times = [ts.index.values if isinstance(ts, (pd.Series, pd.DataFrame))
+                 else TimeUnits.format_timestamps(np.asarray(ts), time_units) for ts in data]
+        offsets = np.zeros(len(times) + 1, dtype=np.int64)
+        np.cumsum([len(t) for t in times], out=offsets[1:])
+        t = np.concatenate(times).astype(np.int64, copy=False) if times else np.empty(0, dtype=np.int64)
+        self._set(t, offsets, pd.Index(keys), metadata)
+
+    def _set(self, t, offsets, index, metadata):
+        self.t = t
+        self.offsets = offsets
+        self.index = index
+        if isinstance(metadata, pd.DataFrame):
+            # reindexing on keys missing from the metadata would quietly fill them with NaN
+            if not index.isin(metadata.index).all():
+                raise ValueError('the metadata must be indexed by the unit keys')
+            metadata = metadata.reindex(index)
+        else:
+            metadata = pd.DataFrame(metadata, copy=True)
+            if len(metadata.columns):
+                if len(metadata) != len(index):
+                    raise ValueError('the metadata must have one row per unit')
+                metadata.index = index
+            else:
+                metadata = pd.DataFrame(index=index)
+        self.metadata = metadata
+        self.nts_class = self.__class__.__name__
+
+    @classmethod
+    def from_arrays(cls, t, offsets, index=None, metadata=None):
+        """
+        makes a TsGroup from arrays already in the group layout, without copy
+        :param t: the int64 times (us) of all the units, sorted within each unit
+        :param offsets: the (n_units + 1) positions of the first time of each unit in t, and len(t)
+        :param index: the unit keys (default: 0, 1, ...)
+        :param metadata: the per-unit metadata, as in the constructor
+        :return: the TsGroup
+        """
+        offsets = np.asarray(offsets, dtype=np.int64)
+        if len(offsets) == 0 or offsets[0] != 0 or offsets[-1] != len(t) or (np.diff(offsets) < 0).any():
+            raise ValueError('offsets must increase from 0 to the number of times')
+        group = cls.__new__(cls)
+        index = pd.Index(index if index is not None else np.arange(len(offsets) - 1))
+        group._set(np.asarray(t).astype(np.int64, copy=False), offsets, index, metadata)
+        return group
+
+    def __len__(self):
+        return len(self.index)
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def keys(self):
+        return list(self.index)
+
+    def values(self):
+        return [self[k] for k in self.index]
+
+    def items(self):
+        return [(k, self[k]) for k in self.index]
+
+    def __getitem__(self, key):
+        """
+        the Ts of a unit, its times being a view on the group array, or a TsGroup with the units of a list of keys
+        """
+        if isinstance(key, (list, np.ndarray, pd.Index)):
+            positions = self.index.get_indexer(key)
+            if (positions < 0).any():
+                raise KeyError(key)
+            lo = self.offsets[positions]
+            hi = self.offsets[positions + 1]
+            offsets = np.zeros(len(positions) + 1, dtype=np.int64)
+            np.cumsum(hi - lo, out=offsets[1:])
+            return TsGroup.from_arrays(self.t[_slices_index(lo, hi)], offsets, self.index[positions],
+                                       self.metadata.iloc[positions])
+        i = self.index.get_loc(key)
+        return _ts_from_times(self.t[self.offsets[i]:self.offsets[i + 1]])
+
+    def unit_times(self):
+        """
+        the int64 times (us) of each unit, as a list of views on the group array
+        """
+        return [self.t[self.offsets[i]:self.offsets[i + 1]] for i in range(len(self))]
+
+    def rates(self, iset=None, time_units='s'):
+        """
+        the mean rate of each unit
+        :param iset: the IntervalSet over which the rates are computed (default: from the first to the last time of
+        the group)
+        :param time_units: the time units of the rates (rates per second by default)
+        :return: a pandas Series of rates, indexed by the unit keys
+        """
+        if iset is not None:
+            iset = _as_interval_set(iset)
+            group = self.restrict(iset)
+            duration = (iset['end'].values - iset['start'].values).sum()
+        else:
+            group = self
+            duration = self.t.max() - self.t.min() if len(self.t) else 0
+        duration = TimeUnits.return_timestamps(np.float64(duration), _as_time_units(time_units))
+        return pd.Series(np.diff(group.offsets) / duration if duration else np.nan, index=self.index)
+
+    def restrict(self, iset):
+        """
+        Restricts all the units to a set of times delimited by a :func:`~neuroseries.interval_set.IntervalSet`.
+
+        The bounds of the intervals are searched in the times of each unit, and the selected times of all units are
+        gathered at once.
+
+        Args:
+            iset: the restricting interval set
+
+        Returns:
+            the restricted TsGroup, with the same units and metadata
+        """
+        iset = _as_interval_set(iset)
+        start = iset['start'].values
+        end = iset['end'].values
+        lo = np.empty((len(self), len(start)), dtype=np.int64)
+        hi = np.empty((len(self), len(start)), dtype=np.int64)
+        for i, t in enumerate(self.unit_times()):
+            lo[i] = self.offsets[i] + t.searchsorted(start, side='right')
+            hi[i] = self.offsets[i] + t.searchsorted(end, side='right')
+        offsets = np.zeros(len(self) + 1, dtype=np.int64)
+        np.cumsum((hi - lo).sum(axis=1), out=offsets[1:])
+        return TsGroup.from_arrays(self.t[_slices_index(lo.ravel(), hi.ravel())], offsets, self.index,
+                                   self.metadata)
+
+    def count(self, bin_size, iset=None, time_units=None, partial='drop'):
+        """
+        counts the times of all the units in regular bins, aligned on the start of each interval of iset
+        (see :func:`count_func`)
+        :param bin_size: the bin duration
+        :param iset: the IntervalSet in which the times are counted (default: the span of the group)
+        :param time_units: the time units of bin_size
+        :param partial: 'drop' or 'keep' the last, shorter bin of each interval
+        :return: a (bins x units) TsdFrame of int32 counts, indexed by the bin centers, with the unit keys as
+        columns
+        """
+        return count_func(self, bin_size, iset=iset, time_units=time_units, partial=partial)
+
+    def realign(self, t, align='closest', tolerance=None, time_units=None):
+        """
+        Moves the times of all the units to the closest (or next, or previous) times in t, for example to put
+        spikes on the sampling grid of a TsdFrame. The times without a match are dropped.
+        :param t: the aligning series, in numpy or pandas format (sorted)
+        :param align: 'closest', 'next' or 'prev', or the equivalent pandas reindex methods
+        :param tolerance: if not None, the maximum distance between a time of the group and its match
+        :param time_units: the time units of tolerance, and of t if it is not a pandas object
+        :return: the realigned TsGroup, with the same units and metadata
+        """
+        method = _get_restrict_method(align)
+        if isinstance(t, (pd.Series, pd.DataFrame)):
+            t = t.index.values
+        elif isinstance(t, RegularTsdFrame):
+            t = t.time_axis
+        else:
+            t = TimeUnits.format_timestamps(t, time_units)
+        if tolerance is not None:
+            tolerance = TimeUnits.format_timestamps(np.array((tolerance,), dtype=np.float64), time_units)[0]
+        ix = _realign_index(t, self.t, method, tolerance)
+        matched = ix >= 0
+        kept = np.zeros(len(matched) + 1, dtype=np.int64)
+        np.cumsum(matched, out=kept[1:])
+        return TsGroup.from_arrays(t[ix[matched]], kept[self.offsets], self.index, self.metadata)
+
+    def as_dataframe(self):
+        """
+        Returns:
+            a DataFrame with the times of all the units as index and the position of their unit in the column
+            'unit', the format in which the group is stored
+        """
+        unit = np.repeat(np.arange(len(self), dtype=np.int32), np.diff(self.offsets))
+        return pd.DataFrame({'unit': unit}, index=pd.Index(self.t, name="Time (us)"))
+
+    @property
+    def units(self):
+        """
+        the unit keys, as a list
+        """
+        return list(self.index)
+
+    @property
+    def unit_metadata(self):
+        """
+        the per-unit metadata, as a dict of lists
+        """
+        return self.metadata.to_dict('list')
+
+    @classmethod
+    def from_stored(cls, df, metadata):
+        """
+        makes a TsGroup from the DataFrame and metadata written by :func:`store`
+        """
+        unit = df['unit'].values
+        units = metadata['units']
+        offsets = unit.searchsorted(np.arange(len(units) + 1), side='left').astype(np.int64)
+        return cls.from_arrays(df.index.values, offsets, units, metadata.get('unit_metadata'))
+
+    def store(self, the_store, key, **kwargs):
+        store(self, the_store, key, **kwargs)
+
+    @property
+    def r(self):
+        """
+        if in a Range context, returns the TsGroup restricted to that Range
+        Returns:
+            the restricted TsGroup
+        """
+        return Range.restricted(self, lambda data, interval: data.restrict(interval))
+
+    @property
+    def r_cache(self):
+        return Range.cache.peek(self, Range.interval)
+
+    def invalidate_restrict_cache(self):
+        Range.cache.discard_object(self)
+
+    def __repr__(self):
+        return 'TsGroup(' + str(len(self)) + ' units, ' + str(len(self.t)) + ' times)'
+
+
+def _regular_without_gaps(data, min_gap, method):
+    """
+    True if a regularly sampled series has no gaps longer than min_gap, from the two possible sampling intervals
+    """
+    dt = data.time_axis.dt
     if method == 'absolute':
-        pass
+        threshold = min_gap * TimeUnits.default_time_units.conversion_factor
     elif method == 'median':
-        md = np.median(dt)
-        min_gap *= md
+        threshold = min_gap * np.floor(dt)
     else:
         raise ValueError('unrecognized method')
+    return len(data) < 2 or np.ceil(dt) <= threshold
+
+
+def _time_axis(data):
+    """
+    the times of a Tsd/TsdFrame, or the arithmetic time axis of a RegularTsdFrame (which is not materialized)
+    """
+    return data.time_axis if isinstance(data, RegularTsdFrame) else data.index.values
+
+
+def _segment(data, lo, hi):
+    """
+    the samples lo:hi of a Tsd, TsdFrame or RegularTsdFrame, as views where possible
+    """
+    if isinstance(data, RegularTsdFrame):
+        return TsdFrame(pd.DataFrame(data.values[lo:hi], index=data.time_axis[lo:hi], columns=data.columns,
+                                     copy=False))
+    if isinstance(data, Tsd):
+        return Tsd(pd.Series(data.values[lo:hi], index=data.index[lo:hi], copy=False))
+    return data.iloc[lo:hi]
 
-    ix = np.where(dt > min_gap)
-    t = data.times()
-    st = t[ix] + 1
-    en = t[(np.array(ix) + 1)] - 1
+
+def _int_times(data):
+    """
+    the int64 times (us) of a Tsd/TsdFrame/RegularTsdFrame, without copy for pandas objects
+    """
+    if isinstance(data, RegularTsdFrame):
+        return data.time_axis[:]
+    return data.index.values
+
+
+def _median(a):
+    """
+    the median of a non-empty array, by partial sort
+    """
+    k = len(a) // 2
+    if len(a) % 2:
+        return np.partition(a, k)[k]
+    part = np.partition(a, (k - 1, k))
+    return (part[k - 1] + part[k]) / 2
+
+
+def _gap_threshold(dt, min_gap, method):
+    """
+    the threshold (us) above which an inter-sample interval is a gap
+    """
+    if method == 'absolute':
+        return min_gap * TimeUnits.default_time_units.conversion_factor
+    elif method == 'median':
+        return min_gap * _median(dt) if len(dt) else 0
+    raise ValueError('unrecognized method')
+
+
+def _gap_bounds(t, min_gap, method):
+    """
+    the (start, end) bounds of the gaps in sorted int64 times, each gap spanning from 1 us after a sample to 1 us
+    before the next one
+    """
+    dt = np.diff(t)
+    return _gaps_above(t, dt, _gap_threshold(dt, min_gap, method))
+
+
+def _gaps_above(t, dt, threshold):
+    """
+    the (start, end) bounds of the gaps between the sorted int64 times t whose intervals dt are above threshold
+    (us)
+    """
+    ix = np.flatnonzero(dt > threshold)
+    # an interval of 1 us between samples does not leave any time for a gap
+    ix = ix[dt[ix] > 1]
+    return t[ix] + 1, t[ix + 1] - 1
+
+
+def _support_bounds(t, gap_start, gap_end):
+    """
+    the (start, end) bounds of the support of sorted int64 times, obtained by inverting their gaps
+    """
+    start = np.empty(len(gap_start) + 1, dtype=np.int64)
+    end = np.empty(len(gap_start) + 1, dtype=np.int64)
+    start[0] = t[0] - 1
+    start[1:] = gap_end
+    end[:-1] = gap_start
+    end[-1] = t[-1] + 1
+    return start, end
+
+
+def _per_column(data, min_gap, method, support):
+    """
+    the gaps (or support) of each column of a TsdFrame, ignoring its NaN values: each column only has the
+    times at which it is defined. The columns are processed one at a time, so that only the valid times of one
+    column are held in memory on top of the data.
+    """
     from neuroseries.interval_set import IntervalSet
-    return IntervalSet(st, en)
+    t = _int_times(data)
+    values = np.asarray(data.values)
+    result = {}
+    for c, name in enumerate(data.columns):
+        tc = t[~np.isnan(values[:, c])] if values.dtype.kind in 'fc' else t
+        gap_start, gap_end = _gap_bounds(tc, min_gap, method)
+        if not support:
+            result[name] = IntervalSet.from_sorted_arrays(gap_start, gap_end)
+        elif len(tc) == 0:
+            result[name] = IntervalSet.from_sorted_arrays(np.empty((0, 2), dtype=np.int64))
+        else:
+            result[name] = IntervalSet.from_sorted_arrays(*_support_bounds(tc, gap_start, gap_end))
+    return result
 
 
-def support_func(data, min_gap, method='absolute'):
+def gaps_func(data, min_gap, method='absolute', per_column=False):
     """
-    find the smallest (to a min_gap resolution) IntervalSet containing all the times in the Tsd
+    finds gaps in a tsd, in a single pass over its int64 times
     :param data: a Tsd/TsdFrame
     :param min_gap: the minimum gap that will be considered
-    :param method: 'absolute': min gap is expressed in time (us), 'median',
+    :param method: 'absolute': min gap is expressed in time (in the default time units), 'median',
     min_gap expressed in units of the median inter-sample event
-    :return: an IntervalSet
+    :param per_column: if True (TsdFrame only), finds the gaps of each column separately, the NaN values being
+    treated as missing samples
+    :return: an IntervalSet containing the gaps in the TSd, or a dict of IntervalSet's by column if per_column
     """
+    if per_column:
+        return _per_column(data, min_gap, method, support=False)
+    from neuroseries.interval_set import IntervalSet
+    start, end = _gap_bounds(_int_times(data), min_gap, method)
+    return IntervalSet.from_sorted_arrays(start, end)
 
-    here_gaps = data.gaps(min_gap, method=method)
-    t = data.times(microseconds)
+
+def support_func(data, min_gap, method='absolute', per_column=False):
+    """
+    find the smallest (to a min_gap resolution) IntervalSet containing all the times in the Tsd, computed directly
+    from the gap bounds
+    :param data: a Tsd/TsdFrame
+    :param min_gap: the minimum gap that will be considered
+    :param method: 'absolute': min gap is expressed in time (in the default time units), 'median',
+    min_gap expressed in units of the median inter-sample event
+    :param per_column: if True (TsdFrame only), finds the support of each column separately, the NaN values being
+    treated as missing samples
+    :return: an IntervalSet, or a dict of IntervalSet's by column if per_column
+    """
+    if per_column:
+        return _per_column(data, min_gap, method, support=True)
     from neuroseries.interval_set import IntervalSet
-    span = IntervalSet(t[0] - 1, t[-1] + 1)
-    support_here = span.set_diff(here_gaps)
-    return support_here
+    t = _int_times(data)
+    if len(t) == 0:
+        return IntervalSet.from_sorted_arrays(np.empty((0, 2), dtype=np.int64))
+    start, end = _support_bounds(t, *_gap_bounds(t, min_gap, method))
+    return IntervalSet.from_sorted_arrays(start, end)
+
+
+def _realign_index(t_data, t, method, tolerance=None):
+    """
+    matches each time in t to a position in the sorted times t_data
+    :param t_data: the sorted times of the data (an array, or the time axis of a RegularTsdFrame)
+    :param t: the times to be matched
+    :param method: 'nearest', 'bfill' or 'pad', as returned by _get_restrict_method
+    :param tolerance: the maximum distance of a match, or None
+    :return: an int64 array with the matched positions, -1 for no match
+    """
+    n = len(t_data)
+    if method == 'pad':
+        ix = t_data.searchsorted(t, side='right').astype(np.int64, copy=False) - 1
+    else:
+        ix = t_data.searchsorted(t, side='left').astype(np.int64, copy=False)
+        if method == 'nearest':
+            # as in pandas, the previous point is preferred only if strictly closer
+            prev = ix - 1
+            has_prev = prev >= 0
+            prev_closer = np.zeros(len(ix), dtype=bool)
+            prev_closer[has_prev] = (ix[has_prev] == n) | \
+                ((t[has_prev] - t_data[prev[has_prev]]) < (t_data[np.minimum(ix[has_prev], n - 1)] - t[has_prev]))
+            ix[prev_closer] -= 1
+        ix[ix == n] = -1
+
+    if tolerance is not None:
+        valid = ix >= 0
+        valid[valid] = np.abs(t_data[ix[valid]] - t[valid]) <= tolerance
+        ix[~valid] = -1
+    return ix
+
+
+def realign_func(data, t, align='closest', tolerance=None, time_units=None, return_indices=False):
+    """
+    realigns a Tsd/TsdFrame to the times in t
+    :param data: a Tsd/TsdFrame
+    :param t: the aligning series, in numpy or pandas format
+    :param align: 'closest', 'next' or 'prev', or the equivalent pandas reindex methods
+    :param tolerance: if not None, the maximum distance between a time in t and the matched data point
+    :param time_units: the time units of tolerance, and of t if it is not a pandas object
+    :param return_indices: if True, also returns the matched positions and the time offsets
+    :return: the realigned Tsd/TsdFrame, or a tuple (realigned, indices, offsets)
+    """
+    method = _get_restrict_method(align)
+    if isinstance(t, (pd.Series, pd.DataFrame)):
+        t = t.index.values
+    else:
+        t = TimeUnits.format_timestamps(t, time_units)
+    if tolerance is not None:
+        tolerance = TimeUnits.format_timestamps(np.array((tolerance,), dtype=np.float64), time_units)[0]
+
+    t_data = data.time_axis if isinstance(data, RegularTsdFrame) else data.index.values
+    if len(t_data) == 0:
+        ix = np.full(len(t), -1, dtype=np.int64)
+        matched = np.zeros(len(t), dtype=bool)
+        values = np.full((len(t),) + np.shape(data.values)[1:], np.nan)
+    else:
+        ix = _realign_index(t_data, t, method, tolerance)
+        matched = ix >= 0
+        values = data.values[np.where(matched, ix, 0)]
+    if not matched.all():
+        if values.dtype.kind not in 'fc':
+            values = values.astype(np.float64)
+        values[~matched] = np.nan
+
+    if isinstance(data, Tsd):
+        realigned = Tsd(pd.Series(values, index=t, copy=False))
+    else:
+        realigned = TsdFrame(pd.DataFrame(values, index=t, columns=data.columns, copy=False))
+
+    if return_indices:
+        offsets = np.zeros(len(t), dtype=np.int64)
+        offsets[matched] = t[matched] - t_data[ix[matched]]
+        return realigned, ix, offsets
+    return realigned
+
+
+def split_func(data, iset, as_arrays=False):
+    """
+    iterates over the intervals of an IntervalSet, yielding the part of a Tsd/TsdFrame/RegularTsdFrame in each
+    interval
+    :param data: a Tsd/TsdFrame/RegularTsdFrame
+    :param iset: the interval set
+    :param as_arrays: if True, the segments are yielded as a tuple (times, data) of numpy views
+    :return: a generator of tuples (start, end, segment), one per interval
+    """
+    iset = _as_interval_set(iset)
+    lo, hi = iset.slice_bounds(data)
+    start = iset['start'].values
+    end = iset['end'].values
+    if as_arrays:
+        t = _time_axis(data)
+        d = data.values
+        for i in range(len(lo)):
+            yield start[i], end[i], (t[lo[i]:hi[i]], d[lo[i]:hi[i]])
+    else:
+        for i in range(len(lo)):
+            yield start[i], end[i], _segment(data, lo[i], hi[i])
+
+
+def _count_bins(iset, bin_size, partial):
+    """
+    the bins of the intervals of an IntervalSet, (start + k * bin_size, start + (k + 1) * bin_size] in each
+    interval, and the offset of the first bin of each interval
+    """
+    start = iset['start'].values.astype(np.int64, copy=False)
+    end = iset['end'].values.astype(np.int64, copy=False)
+    length = end - start
+    n_bins = length // bin_size
+    if partial == 'keep':
+        n_bins += length % bin_size > 0
+    elif partial != 'drop':
+        raise ValueError("partial must be 'drop' or 'keep'")
+    offsets = np.zeros(len(start) + 1, dtype=np.int64)
+    np.cumsum(n_bins, out=offsets[1:])
+    labels = _slices_labels(offsets[:-1], offsets[1:])
+    bin_start = start[labels] + (np.arange(offsets[-1], dtype=np.int64) - offsets[labels]) * bin_size
+    bin_end = np.minimum(bin_start + bin_size, end[labels])
+    return start, np.minimum(start + n_bins * bin_size, end), offsets, bin_start, bin_end
+
+
+def count_func(ts_list, bin_size, iset=None, time_units=None, partial='drop'):
+    """
+    counts the spikes of many spike trains in regular bins, giving a (bins x neurons) count matrix.
+
+    The bins are aligned on the start of each interval of iset, bin k of an interval being
+    (start + k * bin_size, start + (k + 1) * bin_size]. The spikes of each train in each interval are found by
+    binary search and binned from their latency with a single bincount, so that the cost is linear in the
+    number of spikes and bins.
+    :param ts_list: a list of spike trains (Ts/Tsd, or sorted arrays of times in us), a dict of them by name, or
+    a TsGroup
+    :param bin_size: the bin duration
+    :param iset: the IntervalSet in which the spikes are counted. If None, a single interval spanning all the
+    spikes, (first spike - 1, last spike]
+    :param time_units: the time units of bin_size
+    :param partial: what to do with the last bin of the intervals whose duration is not a multiple of bin_size:
+    'drop' (the default) leaves it out, and the spikes in it are not counted, 'keep' keeps it as a shorter bin,
+    ending with the interval
+    :return: a TsdFrame of int32 counts, indexed by the bin centers, with a column per spike train (the keys of
+    a dict or TsGroup, or the positions in a list)
+    """
+    from neuroseries.interval_set import IntervalSet
+    if isinstance(ts_list, TsGroup):
+        columns = ts_list.index
+        ts_list = ts_list.unit_times()
+    elif isinstance(ts_list, Mapping):
+        columns = list(ts_list.keys())
+        ts_list = list(ts_list.values())
+    else:
+        columns = None
+    bin_size = int(_to_us((bin_size,), time_units)[0])
+    if bin_size < 1:
+        raise ValueError('bin_size must be at least 1 us')
+    times = [ts.index.values if hasattr(ts, 'index') else np.asarray(ts, dtype=np.int64) for ts in ts_list]
+    if iset is None:
+        non_empty = [t for t in times if len(t)]
+        if non_empty:
+            first = min(t[0] for t in non_empty)
+            last = max(t[-1] for t in non_empty)
+            iset = IntervalSet.from_sorted_arrays(np.array(((first - 1, last),), dtype=np.int64))
+        else:
+            iset = IntervalSet.from_sorted_arrays(np.empty((0, 2), dtype=np.int64))
+    start, end, offsets, bin_start, bin_end = _count_bins(_as_interval_set(iset), bin_size, partial)
+
+    counts = np.zeros((offsets[-1], len(times)), dtype=np.int32)
+    for i, t in enumerate(times):
+        lo = t.searchsorted(start, side='right')
+        hi = t.searchsorted(end, side='right')
+        sel = _slices_index(lo, hi)
+        labels = _slices_labels(lo, hi)
+        bins = offsets[labels] + (t[sel] - start[labels] - 1) // bin_size
+        counts[:, i] = np.bincount(bins, minlength=offsets[-1])
+    return TsdFrame(pd.DataFrame(counts, index=(bin_start + bin_end) // 2, columns=columns, copy=False))
 
 
 # noinspection PyUnusedLocal
@@ -650,52 +1820,215 @@ def filter_time_series(data, columns=None):
     pass
 
 
-def store(data, the_store, key, **kwargs):
+def _data_to_store(data):
+    if isinstance(data, Tsd):
+        return data.as_series()
+    if isinstance(data, TsGroup):
+        return data.as_dataframe()
+    if isinstance(data, RegularTsdFrame):
+        return pd.DataFrame(data.values, columns=data.columns, copy=False)
+    return pd.DataFrame(data)
+
+
+def _check_append(data, the_store, key):
+    """
+    checks that data can be appended to the object stored under key, keeping the times (or intervals) sorted
+    """
+    if not hasattr(the_store, 'select') or key not in the_store:
+        return
+    last = the_store.select(key, start=-1)
+    if len(last) == 0 or len(data) == 0:
+        return
+    if 'start' in getattr(last, 'columns', ()):
+        first_new, last_stored = data['start'].values[0], last['end'].values[-1]
+        ok = first_new >= last_stored
+    else:
+        first_new, last_stored = data.index.values[0], last.index.values[-1]
+        ok = first_new > last_stored
+    if not ok:
+        raise ValueError('appended data must start after the end of the stored data')
+
+
+def _put(the_store, key, data_to_store, metadata, **kwargs):
+    """
+    writes data with its metadata, once
+    """
+    if isinstance(the_store, pd.HDFStore) and type(the_store).put is pd.HDFStore.put:
+        # a plain pandas store, the metadata are kept in the node attributes
+        the_store.put(key, data_to_store, **kwargs)
+        the_store.get_storer(key).attrs.metadata = metadata
+    else:
+        the_store.put(key, data_to_store, metadata, **kwargs)
+
+
+def store(data, the_store, key, append=False, **kwargs):
     """
     Stores data in a pandas store
     Args:
         data: the nts object to story
         the_store: the store
         key: the HDF5 key
-        **kwargs:
+        append: if True, the data are appended to the object already stored under key (if any), which must be
+        stored in table format. The times of the appended data must follow the stored ones.
+        **kwargs: arguments passed to the put method of the store
 
     Returns:
         None
     """
-    if isinstance(data, Tsd):
-        data_to_store = data.as_series()
-    else:
-        data_to_store = pd.DataFrame(data)
-
-    the_store[key] = data_to_store
+    data_to_store = _data_to_store(data)
     # noinspection PyProtectedMember
     metadata = {k: getattr(data, k) for k in data._metadata}
-    the_store.put(key, data_to_store, metadata, **kwargs)
+    if append:
+        if isinstance(data, (TsGroup, RegularTsdFrame)):
+            raise ValueError('a ' + data.nts_class + ' cannot be appended to')
+        _check_append(data_to_store, the_store, key)
+        kwargs = dict(kwargs, format='table', append=True)
+    _put(the_store, key, data_to_store, metadata, **kwargs)
+
 
+def store_many(objects, the_store, append=False, **kwargs):
+    """
+    Stores several objects (for example a whole session) in a pandas store, flushing it once at the end
+    Args:
+        objects: a dict of nts objects, keyed by the HDF5 keys
+        the_store: the store, or the path of an HDF5 file, opened once for all the objects
+        append: as in :func:`store`
+        **kwargs: arguments passed to the put method of the store
+
+    Returns:
+        None
+    """
+    if not hasattr(the_store, 'put'):
+        with pd.HDFStore(the_store, mode='a') as opened_store:
+            store_many(objects, opened_store, append, **kwargs)
+        return
+    for key, data in objects.items():
+        store(data, the_store, key, append=append, **kwargs)
+    if hasattr(the_store, 'flush'):
+        the_store.flush()
+
+
+def _extractable_classes():
+    from neuroseries.interval_set import IntervalSet
+    extractable_classes = [Ts, Tsd, TsdFrame, IntervalSet, TsGroup, RegularTsdFrame]
+    return {c.__name__: c for c in extractable_classes}
+
+
+def _extract(v, metadata, extractable_classes_id):
+    """
+    the neuroseries object stored as v with its metadata, or None if it is not a neuroseries object
+    """
+    if hasattr(v, 'nts_class') and v.nts_class in extractable_classes_id:
+        nts_class = extractable_classes_id[v.nts_class]
+    elif metadata is not None and \
+            'nts_class' in metadata and \
+            metadata['nts_class'] in extractable_classes_id:
+        nts_class = extractable_classes_id[metadata['nts_class']]
+    else:
+        return None
+    if hasattr(nts_class, 'from_stored'):
+        return nts_class.from_stored(v, metadata)
+    return nts_class(v)
 
-def extract_from(storer):
+
+def _get_metadata(storer, k):
+    """
+    the metadata of a key, read without loading the data
+    Returns:
+        a tuple (available, metadata), available being False if the store cannot give the metadata without
+        loading the data
+    """
+    if hasattr(storer, 'get_metadata'):
+        return True, storer.get_metadata(k)
+    if hasattr(storer, 'get_storer'):
+        attrs = storer.get_storer(k).attrs
+        return True, getattr(attrs, 'metadata', None)
+    return False, None
+
+
+def _get_with_metadata(storer, k):
+    if hasattr(storer, 'get_with_metadata'):
+        return storer.get_with_metadata(k)
+    return storer[k], _get_metadata(storer, k)[1]
+
+
+class LazyExtract(Mapping):
+    """
+    A read-only mapping from the keys of a store to the neuroseries objects they contain, returned by
+    :func:`extract_from` with lazy=True.
+
+    The keys and their classes are listed from the metadata only. The objects are loaded on first access and
+    kept in a cache of the cache_size most recently used ones. If the store cannot give the metadata without
+    loading the data, all its keys are listed, and those not containing a neuroseries object raise KeyError
+    when accessed.
+    """
+    def __init__(self, storer, cache_size=32):
+        self.storer = storer
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.extractable_classes_id = _extractable_classes()
+        self.classes = {}
+        for k in storer.keys():
+            k = k[1:]
+            available, metadata = _get_metadata(storer, k)
+            if not available:
+                self.classes[k] = None
+            elif metadata is not None and metadata.get('nts_class') in self.extractable_classes_id:
+                self.classes[k] = metadata['nts_class']
+
+    def nts_class(self, k):
+        """
+        the class name of the object stored under key k (None if it is only known after loading)
+        """
+        return self.classes[k]
+
+    def __getitem__(self, k):
+        if k in self.cache:
+            self.cache.move_to_end(k)
+            return self.cache[k]
+        if k not in self.classes:
+            raise KeyError(k)
+        (v, metadata) = _get_with_metadata(self.storer, k)
+        data = _extract(v, metadata, self.extractable_classes_id)
+        if data is None:
+            raise KeyError(k)
+        self.cache[k] = data
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return data
+
+    def __iter__(self):
+        return iter(self.classes)
+
+    def __len__(self):
+        return len(self.classes)
+
+    def __repr__(self):
+        return 'LazyExtract(' + repr(self.classes) + ')'
+
+
+def extract_from(storer, lazy=False, cache_size=32):
     """
     Extracts data from a stor
     Args:
         storer: the storage
+        lazy: if True, returns a :class:`LazyExtract` mapping, listing the keys from the metadata and loading each
+        object only when it is accessed
+        cache_size: the number of loaded objects kept by the lazy mapping
 
     Returns:
-        the data as appropriate type
+        the data as appropriate type, in a dict keyed by the store keys
     """
-    from neuroseries.interval_set import IntervalSet
+    if lazy:
+        return LazyExtract(storer, cache_size)
     ks = storer.keys()
-    extractable_classes = [Ts, Tsd, TsdFrame, IntervalSet]
-    extractable_classes_id = {c.__name__: c for c in extractable_classes}
+    extractable_classes_id = _extractable_classes()
 
     variables = {}
     for k in ks:
         k = k[1:]
-        (v, metadata) = storer.get_with_metadata(k)
-        if metadata is not None and \
-                        'nts_class' in metadata and \
-                        metadata['nts_class'] in extractable_classes_id:
-            variables[k] = extractable_classes_id[metadata['nts_class']](v)
-
-        if hasattr(v, 'nts_class') and v.nts_class in extractable_classes_id:
-            variables[k] = extractable_classes_id[v.nts_class](v)
+        (v, metadata) = _get_with_metadata(storer, k)
+        data = _extract(v, metadata, extractable_classes_id)
+        if data is not None:
+            variables[k] = data
     return variables